@@ -0,0 +1,388 @@
+"""
+Load benchmark for the LLM paths: drives POST /api/diagnose and POST /api/chat at a fixed
+concurrency and reports throughput, latency percentiles, fallback rate and event-loop lag.
+
+Each endpoint runs as its own closed-loop phase: --concurrency clients send one request
+after another for --duration seconds (or --requests in total). Diagnose requests cycle
+through every pulse/questionnaire combination; chat clients hold a server-side session
+for --chat-turns turns, then start a new one.
+
+Event-loop lag is sampled from outside: GET /health does no I/O, so its latency above the
+idle baseline is time spent waiting for the server's event loop. The harness's own loop
+lag is reported too; if it is high, the client is the bottleneck.
+
+With --spawn, benchmarks/ollama_stub.py and an API server are started on free ports, the
+API in a temporary directory (fresh database, report cache off unless --report-cache).
+AYURAI_* variables in the environment are passed through to it, e.g. AYURAI_LLM_CONCURRENCY.
+
+Usage (from backend/):
+    python -m benchmarks.llm_load --spawn --concurrency 16 --duration 20 --output llm_load.json
+    python -m benchmarks.llm_load --spawn --ttft 0.5 --token-rate 15 --failure-rate 0.05
+    python -m benchmarks.llm_load --spawn --compare llm_load.json   # exit 1 on regression
+    python -m benchmarks.llm_load --base-url http://127.0.0.1:10000 --token $TOKEN --endpoints chat
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("diagnose", "chat")
+CHAT_MESSAGES = [
+    "What should I eat for breakfast?",
+    "Is it fine to drink cold water after meals?",
+    "Which herbs help with my sleep?",
+    "How long should I follow these recommendations?",
+    "Can I keep exercising in the evening?",
+]
+FALLBACK_DEPTH = "Rule-Based (Standard)"
+# /stub/stats counters reported per phase
+STUB_COUNTERS = ("requests", "failures", "stream_failures", "cancelled", "completed",
+                 "prompt_tokens", "context_tokens_reused")
+
+# Answers collect_symptoms() understands, as in precompute_reports.py (not imported: that
+# pulls in llm_engine and the knowledge base, which the client side does not need)
+PULSE_OPTIONS = [None, {"bpm": 95}, {"bpm": 55}]
+QUESTIONNAIRE_OPTIONS = {
+    "sleep": [None, "disturbed"],
+    "digestion": [None, "acidic", "bloating", "slow"],
+    "energy": [None, "high", "low", "variable"],
+}
+
+def diagnose_payloads():
+    keys = list(QUESTIONNAIRE_OPTIONS)
+    for pulse in PULSE_OPTIONS:
+        for answers in itertools.product(*(QUESTIONNAIRE_OPTIONS[k] for k in keys)):
+            questionnaire = {k: v for k, v in zip(keys, answers) if v is not None}
+            yield {"pulse": pulse, "tongue": None, "questionnaire": questionnaire or None}
+
+# --- Workloads: each call returns True if the answer came from the rule-based fallback ---
+
+class DiagnoseWorkload:
+    def __init__(self):
+        self.payloads = itertools.cycle(list(diagnose_payloads()))
+
+    async def call(self, client, state):
+        response = await client.post("/api/diagnose", json=next(self.payloads))
+        response.raise_for_status()
+        return response.json().get("analysis_depth") == FALLBACK_DEPTH
+
+class ChatWorkload:
+    def __init__(self, turns):
+        self.turns = turns
+        self.sessions = itertools.count(1)
+
+    async def call(self, client, state):
+        if state.get("turn", 0) >= self.turns:
+            state.clear()
+        turn = state.get("turn", 0)
+        if turn == 0:
+            state["number"] = next(self.sessions)
+        # Numbered so concurrent sessions never send identical prompts (those would be coalesced)
+        message = f"{CHAT_MESSAGES[turn % len(CHAT_MESSAGES)]} (patient {state['number']})"
+        body = {"message": message, "session_id": state.get("session_id")}
+        if turn == 0:
+            body["context"] = {"diagnosis": "Pitta", "explanation": "Excess heat in digestion",
+                               "recommendations": "Cooling foods, evening walks"}
+        response = await client.post("/api/chat", json=body)
+        response.raise_for_status()
+        result = response.json()
+        state["session_id"] = result.get("session_id")
+        state["turn"] = turn + 1
+        generation = result.get("generation") or {}
+        return not generation.get("tokens")
+
+# --- Measurement ---
+
+def percentiles(values_s):
+    if not values_s:
+        return None
+    ms = np.asarray(values_s) * 1000.0
+    return {
+        "mean": round(float(ms.mean()), 1),
+        "p50": round(float(np.percentile(ms, 50)), 1),
+        "p95": round(float(np.percentile(ms, 95)), 1),
+        "p99": round(float(np.percentile(ms, 99)), 1),
+        "max": round(float(ms.max()), 1),
+    }
+
+async def probe_baseline(probe, samples=20):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await probe.get("/health")
+        timings.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    return float(np.median(timings))
+
+async def sample_lag(probe, baseline, interval, server_lag, client_lag, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await probe.get("/health")
+            server_lag.append(max(0.0, time.perf_counter() - start - baseline))
+        except httpx.HTTPError:
+            pass
+        # Oversleep of our own loop: the harness falling behind, not the server
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        client_lag.append(max(0.0, time.perf_counter() - before - interval))
+
+async def run_phase(base_url, headers, workload, args, probe, baseline):
+    latencies, errors, fallbacks = [], [], 0
+    server_lag, client_lag = [], []
+    issued = 0
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=args.timeout, limits=limits) as client:
+        end = time.perf_counter() + args.duration
+
+        async def worker():
+            nonlocal issued, fallbacks
+            state = {}
+            while time.perf_counter() < end and (args.requests is None or issued < args.requests):
+                issued += 1
+                start = time.perf_counter()
+                try:
+                    fallback = await workload.call(client, state)
+                    latencies.append(time.perf_counter() - start)
+                    fallbacks += fallback
+                except Exception as e:
+                    errors.append(type(e).__name__)
+                    state.clear()
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_lag(probe, baseline, args.probe_interval, server_lag, client_lag, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    return {
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_types": {name: errors.count(name) for name in set(errors)},
+        "fallbacks": fallbacks,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": percentiles(latencies),
+        "event_loop_lag_ms": percentiles(server_lag),
+        "client_loop_lag_ms": percentiles(client_lag),
+    }
+
+# --- Spawned stub + API server ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def wait_ready(url, process, timeout=120.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+def stub_args(args):
+    return ["--ttft", str(args.ttft), "--token-rate", str(args.token_rate), "--tokens", str(args.tokens),
+            "--prompt-rate", str(args.prompt_rate), "--parallel", str(args.stub_parallel),
+            "--failure-rate", str(args.failure_rate), "--stream-failure-rate", str(args.stream_failure_rate),
+            "--seed", str(args.seed)]
+
+def bench_user_token(workdir):
+    """
+    A user in the spawned server's database (password login is not needed) and a token for it.
+    """
+    import database
+    from auth import create_access_token
+    email = "llm-load@ayurai.local"
+    cwd = os.getcwd()
+    os.chdir(workdir)  # database.DB_NAME is relative to the server's working directory
+    try:
+        database.create_user(email, "!", "LLM load benchmark")
+    finally:
+        os.chdir(cwd)
+    return create_access_token({"sub": email})
+
+@contextlib.asynccontextmanager
+async def spawned_servers(args):
+    workdir = tempfile.mkdtemp(prefix="ayurai-llm-load-")
+    stub_port, api_port = free_port(), free_port()
+    stub_url, api_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{api_port}"
+    env = dict(os.environ, AYURAI_OLLAMA_URL=stub_url)
+    if args.report_cache:
+        env.update(AYURAI_REPORT_CACHE_DB=os.path.join(workdir, "report_cache.db"))
+    else:
+        env.update(AYURAI_REPORT_CACHE_DB="", AYURAI_REPORT_CACHE_BYTES="0")
+    logs = open(os.path.join(workdir, "servers.log"), "w")
+    processes = []
+    try:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.ollama_stub", "--port", str(stub_port), *stub_args(args)],
+            cwd=BACKEND_DIR, stdout=logs, stderr=subprocess.STDOUT))
+        await wait_ready(f"{stub_url}/api/tags", processes[-1])
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--port", str(api_port), "--log-level", "warning"],
+            cwd=workdir, env=env, stdout=logs, stderr=subprocess.STDOUT))
+        await wait_ready(f"{api_url}/health", processes[-1])
+        print(f"stub {stub_url}, API {api_url}, logs in {workdir}", file=sys.stderr)
+        yield api_url, stub_url, bench_user_token(workdir)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        logs.close()
+
+async def fetch_json(url, headers=None):
+    try:
+        async with httpx.AsyncClient(timeout=5.0, headers=headers) as client:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response.json()
+    except httpx.HTTPError:
+        return None
+
+async def run_against(api_url, stub_url, token, args):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    workloads = {"diagnose": DiagnoseWorkload(), "chat": ChatWorkload(args.chat_turns)}
+    results = {}
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout) as probe:
+        baseline = await probe_baseline(probe)
+        for name in args.endpoints:
+            print(f"[{name}] concurrency {args.concurrency}, {args.duration}s", file=sys.stderr)
+            stub_before = await fetch_json(f"{stub_url}/stub/stats") if stub_url else None
+            results[name] = await run_phase(api_url, headers, workloads[name], args, probe, baseline)
+            # Snapshot after the phase (counters are cumulative across phases)
+            health = await fetch_json(f"{api_url}/api/system/health")
+            results[name]["server_llm"] = (health or {}).get("llm")
+            if stub_before:
+                stub_after = await fetch_json(f"{stub_url}/stub/stats") or {}
+                results[name]["stub"] = {key: stub_after[key] - stub_before.get(key, 0) for key in STUB_COUNTERS
+                                         if key in stub_after}
+    return baseline, results
+
+async def run(args):
+    if args.spawn:
+        async with spawned_servers(args) as (api_url, stub_url, token):
+            baseline, results = await run_against(api_url, stub_url, token, args)
+    else:
+        baseline, results = await run_against(args.base_url, args.stub_url, args.token, args)
+    config = {"concurrency": args.concurrency, "duration": args.duration, "requests": args.requests,
+              "chat_turns": args.chat_turns, "report_cache": args.report_cache}
+    if args.spawn:
+        config["stub"] = {"ttft": args.ttft, "token_rate": args.token_rate, "tokens": args.tokens,
+                          "prompt_rate": args.prompt_rate, "parallel": args.stub_parallel,
+                          "failure_rate": args.failure_rate, "stream_failure_rate": args.stream_failure_rate,
+                          "seed": args.seed}
+        config["server_env"] = {k: v for k, v in os.environ.items() if k.startswith("AYURAI_")}
+    return {
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "probe_baseline_ms": round(baseline * 1000, 2),
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, tolerance):
+    """
+    Regressions: throughput down, or p95 latency / p95 event-loop lag up, by more than `tolerance` (fraction).
+    """
+    regressions = []
+    for name, new in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        if old.get("throughput_rps") and new.get("throughput_rps") is not None and \
+                new["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {old['throughput_rps']} -> {new['throughput_rps']}")
+        for metric in ("latency_ms", "event_loop_lag_ms"):
+            before, after = (old.get(metric) or {}).get("p95"), (new.get(metric) or {}).get("p95")
+            # Lag of a few ms is noise; only compare once it is noticeable
+            floor = 5.0 if metric == "event_loop_lag_ms" else 0.0
+            if before is not None and after is not None and after > max(before, floor) * (1 + tolerance):
+                regressions.append(f"{name}: {metric} p95 {before} -> {after}")
+    return regressions
+
+def print_table(report):
+    print(f"{'endpoint':10} {'req':>6} {'err':>5} {'fallbk':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'lag p95':>8} {'lag max':>8}")
+    for name, r in report["results"].items():
+        lat = r["latency_ms"] or {}
+        lag = r["event_loop_lag_ms"] or {}
+        print(f"{name:10} {r['requests']:>6} {r['errors']:>5} {r['fallbacks']:>6} {str(r['throughput_rps']):>8} "
+              f"{str(lat.get('p50', '-')):>9} {str(lat.get('p95', '-')):>9} {str(lat.get('p99', '-')):>9} "
+              f"{str(lag.get('p95', '-')):>8} {str(lag.get('max', '-')):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AyurAI LLM-path load benchmark")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--spawn", action="store_true", help="Start the Ollama stub and an API server")
+    target.add_argument("--base-url", help="Existing API server")
+    parser.add_argument("--token", help="Bearer token for --base-url")
+    parser.add_argument("--stub-url", help="Ollama stub behind --base-url, for its stats")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per endpoint")
+    parser.add_argument("--requests", type=int, help="Stop each endpoint after this many requests")
+    parser.add_argument("--chat-turns", type=int, default=4, help="Turns per chat session")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="Seconds between lag probes")
+    parser.add_argument("--report-cache", action="store_true", help="Keep the LLM report cache on (--spawn)")
+    stub = parser.add_argument_group("Ollama stub (--spawn)")
+    stub.add_argument("--ttft", type=float, default=0.3)
+    stub.add_argument("--token-rate", type=float, default=25.0)
+    stub.add_argument("--tokens", type=int, default=60)
+    stub.add_argument("--prompt-rate", type=float, default=400.0)
+    stub.add_argument("--stub-parallel", type=int, default=2)
+    stub.add_argument("--failure-rate", type=float, default=0.0)
+    stub.add_argument("--stream-failure-rate", type=float, default=0.0)
+    stub.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional change")
+    args = parser.parse_args()
+    if args.base_url and not args.token:
+        parser.error("--base-url needs --token")
+
+    report = asyncio.run(run(args))
+    print_table(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
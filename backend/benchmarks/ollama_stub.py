@@ -0,0 +1,226 @@
+"""
+Local stand-in for the parts of the Ollama API that llm_engine.py uses, so the LLM paths
+can be load-tested without a model server.
+
+  GET  /api/tags      model list (the engine's health probe)
+  POST /api/generate  prompt -> text; streamed NDJSON or one JSON body, `format: json`
+                      answers with a report-shaped object, returns `context` (not for
+                      `raw` prompts) and timings
+  POST /api/chat      messages -> assistant message, same timing model
+  GET  /stub/stats    requests, failures, cancellations, concurrency seen
+
+Timing model (all seeded, so runs are reproducible): requests beyond --parallel wait for a
+slot (like OLLAMA_NUM_PARALLEL); each then spends prompt_tokens / --prompt-rate on prompt
+evaluation (tokens passed back in `context` are free, as with Ollama's KV cache), --ttft
+more before the first token, and decodes --tokens tokens at --token-rate.
+--failure-rate answers that share of requests with HTTP 500; --stream-failure-rate breaks
+that share of streams part-way through.
+
+Usage (from backend/):
+    python -m benchmarks.ollama_stub --port 11500 --ttft 0.3 --token-rate 25
+    AYURAI_OLLAMA_URL=http://127.0.0.1:11500 uvicorn main:app --port 10000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPORT_ANSWER = {
+    "explanation": "Elevated Pitta: heat and sharpness dominate digestion and temperament.",
+    "recommendations": ["Cooling foods such as cucumber and mint", "Avoid spicy and fried food",
+                        "Evening walks and meditation"],
+    "reasoning": "A fast pulse with acidic digestion points to aggravated Pachaka Pitta.",
+    "reference": "Charaka Samhita, Sutrasthana 12",
+    "confidence_score": 82,
+    "analysis_depth": "Deep"
+}
+CHAT_WORDS = ("Favour warm cooked meals, keep a regular routine, sip cumin coriander fennel tea "
+              "after lunch and rest early to let Vata settle. ").split(" ")
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def answer_tokens(report, count):
+    """
+    The answer split into `count` pieces (report answers are valid JSON once joined).
+    """
+    if report:
+        text = json.dumps(REPORT_ANSWER)
+        size = max(1, len(text) // count)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    return [CHAT_WORDS[i % len(CHAT_WORDS)] + " " for i in range(count)]
+
+class StubConfig:
+    def __init__(self, ttft=0.3, token_rate=25.0, tokens=60, prompt_rate=400.0, parallel=1,
+                 failure_rate=0.0, stream_failure_rate=0.0, chunk_tokens=1, model="llama3", seed=0):
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.prompt_rate = prompt_rate
+        self.parallel = parallel
+        self.failure_rate = failure_rate
+        self.stream_failure_rate = stream_failure_rate
+        self.chunk_tokens = chunk_tokens
+        self.model = model
+        self.seed = seed
+
+def create_app(config):
+    app = FastAPI(title="Ollama stub")
+    rng = random.Random(config.seed)
+    slots = asyncio.Semaphore(config.parallel)
+    stats = {"requests": 0, "failures": 0, "stream_failures": 0, "cancelled": 0, "completed": 0,
+             "in_flight": 0, "max_in_flight": 0, "waiting": 0, "max_waiting": 0,
+             "prompt_tokens": 0, "context_tokens_reused": 0}
+
+    async def generation(prompt_tokens, reused, count, report, wrap, stream):
+        """
+        Shared by both endpoints; `wrap(text, done, extra)` shapes one response object.
+        """
+        stats["requests"] += 1
+        if rng.random() < config.failure_rate:
+            stats["failures"] += 1
+            return JSONResponse({"error": "stub: injected failure"}, status_code=500)
+        break_at = int(count * rng.random()) if rng.random() < config.stream_failure_rate else None
+        tokens = answer_tokens(report, count)
+        context = list(range(reused + prompt_tokens + len(tokens)))
+        finished = False
+
+        def final(prompt_seconds, decode_seconds, started):
+            return {"total_duration": int((time.perf_counter() - started) * 1e9),
+                    "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(prompt_seconds * 1e9),
+                    "eval_count": len(tokens), "eval_duration": int(decode_seconds * 1e9),
+                    "context": context}
+
+        async def run():
+            nonlocal finished
+            started = time.perf_counter()
+            stats["waiting"] += 1
+            stats["max_waiting"] = max(stats["max_waiting"], stats["waiting"])
+            try:
+                await slots.acquire()
+            finally:
+                stats["waiting"] -= 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                prompt_seconds = prompt_tokens / config.prompt_rate
+                stats["prompt_tokens"] += prompt_tokens
+                stats["context_tokens_reused"] += reused
+                await asyncio.sleep(prompt_seconds + config.ttft)
+                decode_started = time.perf_counter()
+                step = config.chunk_tokens / config.token_rate
+                for i in range(0, len(tokens), config.chunk_tokens):
+                    if break_at is not None and i >= break_at:
+                        stats["stream_failures"] += 1
+                        # Counted as a failure, not a cancellation, when the caller closes us on it
+                        finished = True
+                        yield {"error": "stub: stream interrupted"}
+                        return
+                    yield "".join(tokens[i:i + config.chunk_tokens])
+                    await asyncio.sleep(step)
+                stats["completed"] += 1
+                finished = True
+                yield final(prompt_seconds, time.perf_counter() - decode_started, started)
+            except (asyncio.CancelledError, GeneratorExit):
+                if not finished:
+                    stats["cancelled"] += 1
+                raise
+            finally:
+                stats["in_flight"] -= 1
+                slots.release()
+
+        if stream:
+            async def lines():
+                # Closing the response (client went away) cancels the generation at once
+                async with contextlib.aclosing(run()) as items:
+                    async for item in items:
+                        if isinstance(item, str):
+                            yield json.dumps(wrap(item, False, {})) + "\n"
+                        elif "error" in item:
+                            yield json.dumps(item) + "\n"
+                        else:
+                            yield json.dumps(wrap("", True, item)) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        text = []
+        async with contextlib.aclosing(run()) as items:
+            async for item in items:
+                if isinstance(item, str):
+                    text.append(item)
+                elif "error" in item:
+                    return JSONResponse(item, status_code=500)
+                else:
+                    return wrap("".join(text), True, item)
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": config.model, "model": config.model}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        raw = bool(body.get("raw"))
+        # Like Ollama, raw prompts neither continue from `context` nor return one
+        reused = 0 if raw else len(body.get("context") or [])
+        prompt_tokens = estimate_tokens(body.get("system", "") + body.get("prompt", ""))
+
+        def wrap(text, done, extra):
+            if raw:
+                extra = {k: v for k, v in extra.items() if k != "context"}
+            return {"model": body.get("model"), "response": text, "done": done, **extra}
+
+        return await generation(prompt_tokens, reused, config.tokens, body.get("format") == "json",
+                                wrap, body.get("stream", True))
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) + 4 for m in body.get("messages", []))
+
+        def wrap(text, done, extra):
+            extra = {k: v for k, v in extra.items() if k != "context"}  # /api/chat has no context
+            return {"model": body.get("model"), "message": {"role": "assistant", "content": text},
+                    "done": done, **extra}
+
+        return await generation(prompt_tokens, 0, config.tokens, body.get("format") == "json",
+                                wrap, body.get("stream", True))
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return stats
+
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local Ollama stand-in for LLM load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first token, after prompt eval")
+    parser.add_argument("--token-rate", type=float, default=25.0, help="Decode tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens per answer")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="Prompt-eval tokens per second")
+    parser.add_argument("--parallel", type=int, default=1, help="Generations served at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--stream-failure-rate", type=float, default=0.0,
+                        help="Share of streams interrupted with an error part-way")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="Tokens per streamed NDJSON line")
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    import uvicorn
+    args = parse_args(argv)
+    config = StubConfig(ttft=args.ttft, token_rate=args.token_rate, tokens=args.tokens,
+                        prompt_rate=args.prompt_rate, parallel=args.parallel,
+                        failure_rate=args.failure_rate, stream_failure_rate=args.stream_failure_rate,
+                        chunk_tokens=args.chunk_tokens, model=args.model, seed=args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
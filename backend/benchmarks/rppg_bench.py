@@ -0,0 +1,257 @@
+"""
+Deterministic rPPG benchmark and accuracy suite.
+
+Generates synthetic face video with a known pulse (see benchmarks/synthetic.py) and
+measures throughput (frames per CPU-second), per-frame latency and BPM error for:
+  - RPPGProcessor directly, per estimator mode, with timestamped JPEG frames and
+    with pre-averaged sample packets
+  - /api/ws/rppg and POST /api/rppg, in-process
+  - POST /api/rppg/video with the clip encoded as webm (mp4 fallback)
+
+Usage (from backend/):
+    python -m benchmarks.rppg_bench --output rppg_bench.json    # exit 1 if a path reports no BPM
+    python -m benchmarks.rppg_bench --compare rppg_bench.json   # ... or on regression
+"""
+import argparse
+import json
+import os
+import platform
+import struct
+import sys
+import time
+
+import cv2
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.synthetic import face_frames, encode_video
+from rppg import (RPPGProcessor, RPPGEngine, center_roi, PACKET_TIMED_FRAME, PACKET_SAMPLES,
+                  SAMPLE_DTYPE, RPPG_MODES)
+
+SCENARIOS = {
+    # Steady 30 fps, light noise, no motion
+    "clean": {"fps": 30, "noise": 1.0, "motion": 0.0, "fps_jitter": 0.0},
+    # Browser under load: ~22 fps with jitter, sensor noise and head sway
+    "realistic": {"fps": 22, "noise": 3.0, "motion": 4.0, "fps_jitter": 0.25},
+}
+
+def build_inputs(bpm, seconds, size, seed, scenario):
+    """
+    One pass over the synthetic video: timestamped JPEG frames plus the
+    client-side ROI means a sample-packet client would send.
+    """
+    jpegs, samples = [], []
+    for ts, frame in face_frames(bpm=bpm, seconds=seconds, size=size, seed=seed, **scenario):
+        jpegs.append((ts, cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()))
+        b, g, r, _ = cv2.mean(center_roi(frame))
+        samples.append((ts, r, g, b))
+    return jpegs, samples
+
+def frame_packets(jpegs):
+    return [bytes([PACKET_TIMED_FRAME]) + struct.pack("<d", ts) + data for ts, data in jpegs]
+
+def sample_packets(samples, per_packet=1):
+    arr = np.array(samples, dtype=SAMPLE_DTYPE)
+    return [bytes([PACKET_SAMPLES]) + arr[i:i + per_packet].tobytes() for i in range(0, len(arr), per_packet)]
+
+def summarize(latencies, cpu_seconds, readings, true_bpm):
+    """
+    latencies in seconds; readings is the BPM reported after each call (None while warming up).
+    """
+    lat_ms = np.asarray(latencies) * 1000.0
+    valid = np.array([r for r in readings if r], dtype=np.float64)
+    return {
+        "calls": len(latencies),
+        "fps_per_core": round(len(latencies) / cpu_seconds, 1) if cpu_seconds > 0 else None,
+        "latency_ms": {
+            "mean": round(float(lat_ms.mean()), 3),
+            "p50": round(float(np.percentile(lat_ms, 50)), 3),
+            "p95": round(float(np.percentile(lat_ms, 95)), 3),
+            "p99": round(float(np.percentile(lat_ms, 99)), 3),
+            "max": round(float(lat_ms.max()), 3),
+        },
+        "final_bpm": int(valid[-1]) if len(valid) else None,
+        "bpm_mae": round(float(np.abs(valid - true_bpm).mean()), 2) if len(valid) else None,
+        "bpm_readings": int(len(valid)),
+    }
+
+def bench_processor(mode, packets, true_bpm):
+    engine = RPPGEngine(capacity=1) if mode == "batched" else None
+    processor = RPPGProcessor(mode=mode, engine=engine)
+    latencies, readings = [], []
+    cpu_start = time.process_time()
+    for i, packet in enumerate(packets):
+        start = time.perf_counter()
+        result = processor.process_packet(packet)
+        latencies.append(time.perf_counter() - start)
+        readings.append(result["bpm"] if result else None)
+        if engine is not None and i % engine.bpm_interval == 0:
+            # Stand-in for the engine's tick loop (counted in CPU time, not per-frame latency)
+            engine.tick()
+    return summarize(latencies, time.process_time() - cpu_start, readings, true_bpm)
+
+def build_app():
+    from routers import vitals
+    app = FastAPI()
+    app.include_router(vitals.router)
+    return app
+
+def bench_websocket(client, mode, packets, true_bpm):
+    from rppg import engine
+    latencies, readings = [], []
+    cpu_start = time.process_time()
+    with client.websocket_connect(f"/api/ws/rppg?mode={mode}") as ws:
+        # Lock-step send/receive so every frame is processed (no drops) and timed end to end
+        for i, packet in enumerate(packets):
+            start = time.perf_counter()
+            ws.send_bytes(packet)
+            reply = ws.receive_json()
+            latencies.append(time.perf_counter() - start)
+            readings.append(reply.get("bpm"))
+            if mode == "batched" and i % engine.bpm_interval == 0:
+                # Lock-step replay outruns the shared engine's 0.5 s wall-clock tick; drive it
+                # per bpm_interval frames as bench_processor does (tick() takes the engine lock)
+                engine.tick()
+    return summarize(latencies, time.process_time() - cpu_start, readings, true_bpm)
+
+def bench_post_frames(client, jpegs, true_bpm):
+    latencies, readings = [], []
+    session_id = None
+    cpu_start = time.process_time()
+    for ts, data in jpegs:
+        form = {"timestamp": str(ts)}
+        if session_id:
+            form["session_id"] = session_id
+        start = time.perf_counter()
+        reply = client.post("/api/rppg", files={"file": ("frame.jpg", data, "image/jpeg")}, data=form).json()
+        latencies.append(time.perf_counter() - start)
+        session_id = reply["session_id"]
+        readings.append(reply.get("bpm"))
+    return summarize(latencies, time.process_time() - cpu_start, readings, true_bpm)
+
+def bench_post_video(client, path, mime, true_bpm, repeats):
+    latencies, readings = [], []
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            reply = client.post("/api/rppg/video", files={"file": (os.path.basename(path), f, mime)}).json()
+        latencies.append(time.perf_counter() - start)
+        readings.append(reply.get("bpm"))
+    result = summarize(latencies, time.process_time() - cpu_start, readings, true_bpm)
+    result["fps_per_core"] = None  # one call per clip; see latency_ms
+    result["container"] = mime
+    return result
+
+def run(args):
+    size = (args.height, args.width)
+    results = {}
+    for name in args.scenarios:
+        scenario = SCENARIOS[name]
+        jpegs, samples = build_inputs(args.bpm, args.seconds, size, args.seed, scenario)
+        frames, sample_pkts = frame_packets(jpegs), sample_packets(samples)
+        print(f"[{name}] {len(jpegs)} frames, {args.bpm} BPM", file=sys.stderr)
+
+        for mode in args.modes:
+            results[f"{name}/direct/{mode}/jpeg"] = bench_processor(mode, frames, args.bpm)
+            results[f"{name}/direct/{mode}/samples"] = bench_processor(mode, sample_pkts, args.bpm)
+
+        if not args.skip_routes:
+            with TestClient(build_app()) as client:
+                for mode in args.modes:
+                    results[f"{name}/ws/{mode}/jpeg"] = bench_websocket(client, mode, frames, args.bpm)
+                results[f"{name}/post/frames"] = bench_post_frames(client, jpegs, args.bpm)
+
+                make_frames = lambda: face_frames(bpm=args.bpm, seconds=args.seconds, size=size,
+                                                  seed=args.seed, **scenario)
+                path, mime = encode_video(make_frames, fps=scenario["fps"], size=size)
+                try:
+                    results[f"{name}/post/video"] = bench_post_video(client, path, mime, args.bpm, args.video_repeats)
+                finally:
+                    os.remove(path)
+
+    return {
+        "config": {
+            "bpm": args.bpm, "seconds": args.seconds, "size": list(size), "seed": args.seed,
+            "scenarios": {name: SCENARIOS[name] for name in args.scenarios},
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+        },
+        "results": results,
+    }
+
+def missing_bpm(report):
+    """
+    Every benchmarked path is expected to report a BPM; None means the path never produced one.
+    """
+    return [name for name, r in report["results"].items() if r.get("final_bpm") is None]
+
+def compare(current, baseline, tolerance, bpm_slack):
+    """
+    Regressions: throughput down by more than `tolerance` (fraction), or BPM MAE up by more than bpm_slack.
+    """
+    regressions = []
+    for name, new in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        if old.get("fps_per_core") and new.get("fps_per_core") and \
+                new["fps_per_core"] < old["fps_per_core"] * (1 - tolerance):
+            regressions.append(f"{name}: fps_per_core {old['fps_per_core']} -> {new['fps_per_core']}")
+        if old.get("bpm_mae") is not None and (new.get("bpm_mae") is None or
+                                               new["bpm_mae"] > old["bpm_mae"] + bpm_slack):
+            regressions.append(f"{name}: bpm_mae {old['bpm_mae']} -> {new.get('bpm_mae')}")
+    return regressions
+
+def print_table(report):
+    print(f"{'benchmark':40} {'fps/core':>10} {'p50 ms':>9} {'p99 ms':>9} {'bpm':>5} {'MAE':>6}")
+    for name, r in report["results"].items():
+        fps = r["fps_per_core"] if r["fps_per_core"] is not None else "-"
+        print(f"{name:40} {fps:>10} {r['latency_ms']['p50']:>9} {r['latency_ms']['p99']:>9} "
+              f"{str(r['final_bpm']):>5} {str(r['bpm_mae']):>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AyurAI rPPG benchmark and accuracy suite")
+    parser.add_argument("--bpm", type=float, default=72)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--modes", nargs="+", default=list(RPPG_MODES), choices=list(RPPG_MODES))
+    parser.add_argument("--video-repeats", type=int, default=3)
+    parser.add_argument("--skip-routes", action="store_true", help="Only benchmark RPPGProcessor directly")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional throughput drop")
+    parser.add_argument("--bpm-slack", type=float, default=2.0, help="Allowed BPM MAE increase")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_table(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    missing = missing_bpm(report)
+    for name in missing:
+        print(f"NO BPM {name}", file=sys.stderr)
+    if missing:
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.bpm_slack)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
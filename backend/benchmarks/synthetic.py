@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import os
+import tempfile
+
+def face_frames(bpm=72, seconds=20, fps=30, size=(480, 640), noise=2.0, motion=4.0,
+                fps_jitter=0.0, pulse_amplitude=1.5, seed=0):
+    """
+    Deterministic synthetic "face" video with a known pulse.
+    A skin-toned ellipse on a dark background whose green (and slightly red) level
+    follows sin(2*pi*bpm/60*t); Gaussian sensor noise, a slow sway of `motion` pixels
+    and +/- fps_jitter relative frame-interval jitter.
+    Yields (timestamp_ms, BGR frame).
+    """
+    rng = np.random.default_rng(seed)
+    h, w = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = np.zeros((h, w, 3), dtype=np.float32)
+    base[...] = (30, 30, 35)
+    skin = np.array([105, 140, 190], dtype=np.float32)  # BGR
+
+    t = 0.0
+    n_frames = int(seconds * fps)
+    for _ in range(n_frames):
+        pulse = np.sin(2 * np.pi * (bpm / 60.0) * t)
+        cy = h / 2 + motion * np.sin(2 * np.pi * 0.2 * t)
+        cx = w / 2 + motion * np.cos(2 * np.pi * 0.13 * t)
+        mask = ((yy - cy) / (0.38 * h)) ** 2 + ((xx - cx) / (0.28 * w)) ** 2 <= 1.0
+
+        frame = base.copy()
+        frame[mask] = skin + np.array([0, pulse_amplitude * pulse, 0.3 * pulse_amplitude * pulse], dtype=np.float32)
+        if noise:
+            frame += rng.normal(0, noise, frame.shape).astype(np.float32)
+        yield t * 1000.0, np.clip(frame, 0, 255).astype(np.uint8)
+
+        interval = 1.0 / fps
+        if fps_jitter:
+            interval *= 1.0 + rng.uniform(-fps_jitter, fps_jitter)
+        t += interval
+
+def encode_video(make_frames, fps=30, size=(480, 640)):
+    """
+    Writes make_frames() to a temporary webm (VP8), falling back to mp4 if VP8 is unavailable.
+    make_frames is called per attempt so frames are streamed, never held in memory.
+    Returns (path, mime type); the caller removes the file.
+    """
+    h, w = size
+    for suffix, fourcc, mime in ((".webm", "VP80", "video/webm"), (".mp4", "mp4v", "video/mp4")):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (w, h))
+        if writer.isOpened():
+            for _, frame in make_frames():
+                writer.write(frame)
+            writer.release()
+            if os.path.getsize(path) > 0:
+                return path, mime
+        writer.release()
+        os.remove(path)
+    raise RuntimeError("No usable video encoder (VP8/mp4v) in this OpenCV build")
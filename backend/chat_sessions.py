@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger("AyurAI.ChatSessions")
+
+# Prompt + answer must fit the model's context window (Ollama's default num_ctx is 2048)
+CHAT_TOKEN_BUDGET = int(os.getenv("AYURAI_CHAT_TOKEN_BUDGET", "1536"))
+CHAT_RESPONSE_RESERVE = int(os.getenv("AYURAI_CHAT_RESPONSE_RESERVE", "384"))
+CHAT_SESSION_TTL = int(os.getenv("AYURAI_CHAT_SESSION_TTL", "3600"))
+CHAT_MAX_SESSIONS = int(os.getenv("AYURAI_CHAT_MAX_SESSIONS", "1000"))
+# Turns trimmed off the prompt are folded into a running summary (one extra short generation)
+CHAT_SUMMARIZE = os.getenv("AYURAI_CHAT_SUMMARIZE", "1") == "1"
+
+def estimate_tokens(text):
+    # ~4 characters per token for English with the Llama-3 tokenizer; only used for trimming
+    return len(text) // 4 + 1
+
+class ChatSession:
+    """
+    One conversation held server-side. While the model's returned `context` (the token
+    state of everything said so far) fits the budget, each turn sends only the new
+    message with it, so Ollama evaluates just that turn. Past the budget the prompt is
+    rebuilt from the newest messages that fit in half the budget (leaving room for the
+    next turns to continue from the new context again), older ones folded into `summary`.
+    """
+    def __init__(self, context=None, history=(), owner=None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner  # user id; other users cannot resume it
+        self.context = dict(context or {})
+        self.messages = [{"role": m["role"], "content": m["content"]} for m in history]
+        self.summary = None
+        self.kv_context = None  # Ollama token context after the last answer
+        self.turns = 0
+        self.rebuilds = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()  # one turn at a time per conversation
+
+    def continue_payload(self, message):
+        """
+        Payload that continues from the stored model context, or None if there is none
+        or it would no longer fit.
+        """
+        if not self.kv_context:
+            return None
+        if len(self.kv_context) + estimate_tokens(message) + CHAT_RESPONSE_RESERVE > CHAT_TOKEN_BUDGET:
+            return None
+        # Ollama templates the new turn and appends it to the stored context
+        return {"prompt": message, "context": self.kv_context}
+
+    async def rebuild_payload(self, engine, message):
+        """
+        Full prompt from the summary and the newest messages that fit half the budget.
+        """
+        self.rebuilds += 1
+        context = self.prompt_context()
+        base = engine.session_chat_payload([], message, context)
+        budget = CHAT_TOKEN_BUDGET // 2 - estimate_tokens(base["system"] + base["prompt"])
+        kept = []
+        for msg in reversed(self.messages):
+            budget -= estimate_tokens(msg["content"]) + 4  # + role header
+            if budget < 0:
+                break
+            kept.append(msg)
+        kept.reverse()
+        dropped = self.messages[:len(self.messages) - len(kept)]
+        if dropped:
+            if CHAT_SUMMARIZE:
+                self.summary = await engine.summarize_conversation(self.summary, dropped) or self.summary
+            self.messages = kept
+            context = self.prompt_context()
+        return engine.session_chat_payload(self.messages, message, context)
+
+    def prompt_context(self):
+        if not self.summary:
+            return self.context
+        return {**self.context, "summary": self.summary}
+
+    def record(self, message, response, kv_context):
+        self.messages.append({"role": "user", "content": message})
+        self.messages.append({"role": "assistant", "content": response})
+        self.kv_context = kv_context or None
+        self.turns += 1
+
+    def as_dict(self):
+        return {
+            "session_id": self.id,
+            "turns": self.turns,
+            "messages": len(self.messages),
+            "summarized": self.summary is not None,
+            "context_tokens": len(self.kv_context) if self.kv_context else 0
+        }
+
+class ChatSessionStore:
+    """
+    In-process LRU of conversations; idle sessions expire after `ttl` seconds.
+    Sessions live in one worker's memory: behind several workers, a client landing on
+    another one sends `history` again and gets a fresh session seeded from it.
+    """
+    def __init__(self, max_sessions=CHAT_MAX_SESSIONS, ttl=CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.created = 0
+        self.expired = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used < self.ttl and len(self.sessions) <= self.max_sessions:
+                break
+            self.sessions.popitem(last=False)
+            self.expired += 1
+
+    def get(self, session_id):
+        self._expire()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def create(self, context=None, history=(), owner=None):
+        session = ChatSession(context, history, owner)
+        self.sessions[session.id] = session
+        self.created += 1
+        self._expire()
+        return session
+
+    def resume(self, session_id, context=None, history=(), owner=None):
+        """
+        The session for `session_id`, or a new one seeded from `context`/`history` if it
+        is unknown or expired (the response carries the new id). None if the session
+        belongs to another owner.
+        """
+        session = self.get(session_id) if session_id else None
+        if session is None:
+            session = self.create(context, history, owner)
+        elif session.owner != owner:
+            return None
+        elif context and context != session.context:
+            # A different report: the stored model context was built on the old one
+            session.context = dict(context)
+            session.kv_context = None
+        return session
+
+    def stats(self):
+        return {
+            "active": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "expired": self.expired,
+            "token_budget": CHAT_TOKEN_BUDGET
+        }
+
+chat_sessions = ChatSessionStore()
@@ -43,6 +43,19 @@ def init_db():
                 full_name TEXT
             )
         ''')
+
+        # One row per indexed tongue image; id is the row in the embedding matrix (embedding_index.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                id INTEGER PRIMARY KEY,
+                image_hash TEXT UNIQUE NOT NULL,
+                label TEXT,
+                confidence REAL,
+                report_id INTEGER,
+                timestamp TEXT,
+                FOREIGN KEY(report_id) REFERENCES reports(id)
+            )
+        ''')
         
         conn.commit()
         conn.close()
@@ -107,6 +120,19 @@ def save_report(diagnosis, symptoms, scores, contradictions, explanation, recomm
         logger.error(f"Failed to save report: {e}")
         return None
 
+def update_report(report_id, explanation, recommendations):
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute('UPDATE reports SET explanation = ?, recommendations = ? WHERE id = ?',
+                       (explanation, json.dumps(recommendations), report_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to update report: {e}")
+        return False
+
 def save_feedback(report_id, rating, comments):
     try:
         conn = sqlite3.connect(DB_NAME)
@@ -152,3 +178,56 @@ def get_history(limit=10):
     except Exception as e:
         logger.error(f"Failed to fetch history: {e}")
         return []
+
+def claim_embedding_row(image_hash, label, confidence, report_id=None):
+    """
+    Saves the metadata under the next free matrix row and returns that row. One
+    statement, so it runs under SQLite's write lock and no two workers get the same
+    row. None if the image is already indexed (or on error).
+    """
+    try:
+        conn = sqlite3.connect(DB_NAME, timeout=5)
+        cursor = conn.cursor()
+        timestamp = datetime.now().isoformat()
+        cursor.execute('''
+            INSERT INTO embeddings (id, image_hash, label, confidence, report_id, timestamp)
+            SELECT COALESCE(MAX(id) + 1, 0), ?, ?, ?, ?, ? FROM embeddings
+        ''', (image_hash, label, confidence, report_id, timestamp))
+        row = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return row
+    except sqlite3.IntegrityError:
+        return None  # indexed by another worker meanwhile
+    except Exception as e:
+        logger.error(f"Failed to save embedding: {e}")
+        return None
+
+def get_embedding_state():
+    """
+    (next free row, set of indexed image hashes) for the embedding matrix.
+    """
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, image_hash FROM embeddings')
+        rows = cursor.fetchall()
+        conn.close()
+        return (max(r[0] for r in rows) + 1 if rows else 0), {r[1] for r in rows}
+    except Exception as e:
+        logger.error(f"Failed to read embeddings: {e}")
+        return 0, set()
+
+def get_embeddings(rows):
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(rows))
+        cursor.execute(f'SELECT * FROM embeddings WHERE id IN ({placeholders})', list(rows))
+        found = {row["id"]: dict(row) for row in cursor.fetchall()}
+        conn.close()
+        return found
+    except Exception as e:
+        logger.error(f"Failed to fetch embeddings: {e}")
+        return {}
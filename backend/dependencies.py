@@ -47,5 +47,10 @@ async def validate_video_file(file: UploadFile = File(...)):
     # MIME type check
     # Note: Blob from browser might just be 'application/octet-stream' sometimes, 
     # but we enforce mime type in frontend request usually.
+    # MediaRecorder blobs may carry codec parameters ("video/webm;codecs=vp9")
+    content_type = (file.content_type or "").split(";")[0].strip().lower()
+    if content_type not in ACCEPTABLE_MIME_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Only {', '.join(ACCEPTABLE_MIME_TYPES)} are allowed.")
     
+    file.file.seek(0)
     return file
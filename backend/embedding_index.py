@@ -0,0 +1,333 @@
+"""
+Similar-case retrieval over ResNet50 (AyurVisionNet backbone) embeddings.
+
+Every analysed tongue image gets a 2048-d L2-normalised float16 vector, appended to a
+memory-mapped matrix next to the SQLite database; the `embeddings` table maps matrix
+rows to image hash, label and report. Cosine similarity is a dot product.
+
+Search is exact (chunked matrix-vector product) up to IVF_THRESHOLD rows. Past that an
+IVF index (spherical k-means lists, built locally with NumPy) narrows the scan to the
+nprobe nearest lists; rows appended since the last build are always scanned exactly.
+
+Rebuild the IVF index offline (from backend/):
+    python -m embedding_index build
+"""
+import argparse
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from database import DB_NAME, init_db, claim_embedding_row, get_embedding_state, get_embeddings
+from model_registry import registry
+
+logger = logging.getLogger("AyurAI.Embeddings")
+
+EMBEDDING_DIM = 2048
+# Indexing runs the ResNet50 backbone once per new image (needs torch/torchvision)
+EMBEDDINGS_ENABLED = os.getenv("AYURAI_EMBEDDINGS", "0") == "1"
+EMBEDDINGS_PATH = os.getenv("AYURAI_EMBEDDINGS_PATH",
+                            os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), "tongue_embeddings.f16"))
+EMBEDDING_WEIGHTS = os.getenv("AYURAI_VISION_WEIGHTS")  # AyurVisionNet state dict; None = ImageNet backbone
+
+IVF_THRESHOLD = int(os.getenv("AYURAI_IVF_THRESHOLD", "100000"))
+IVF_NPROBE = int(os.getenv("AYURAI_IVF_NPROBE", "16"))
+IVF_REBUILD_GROWTH = 0.2  # rebuild once the unindexed tail exceeds 20% of the indexed rows
+
+SEARCH_CHUNK_ROWS = 2048  # 2048 x 2048 float32 = 16 MB working set per chunk (stays cache-friendly)
+
+class EmbeddingExtractor:
+    """
+    AyurVisionNet backbone features for BGR images.
+    """
+    def __init__(self, weights_path=EMBEDDING_WEIGHTS, imgsz=224):
+        import torch
+        from model import load_model
+        self.torch = torch
+        self.model = load_model(weights_path)
+        self.imgsz = imgsz
+
+    def embed(self, images):
+        from onnx_backend import preprocess
+        batch = self.torch.from_numpy(preprocess(images, self.imgsz, "imagenet"))
+        with self.torch.inference_mode():
+            features = self.model.features(batch).numpy()
+        features /= np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+        return features.astype(np.float16)
+
+    def embed_bytes(self, image_bytes):
+        from vision import THUMBNAIL_MIN_SIDE
+        from image_utils import decode_reduced
+        img, _ = decode_reduced(image_bytes, THUMBNAIL_MIN_SIDE)
+        if img is None:
+            return None
+        return self.embed([img])[0]
+
+def _assign(data, centroids):
+    # Nearest centroid by dot product, chunked to bound the (rows x lists) score matrix
+    assign = np.empty(len(data), dtype=np.int32)
+    for lo in range(0, len(data), SEARCH_CHUNK_ROWS):
+        hi = min(len(data), lo + SEARCH_CHUNK_ROWS)
+        assign[lo:hi] = np.argmax(data[lo:hi].astype(np.float32) @ centroids.T, axis=1)
+    return assign
+
+def _spherical_kmeans(data, k, iters=10, seed=0):
+    """
+    k-means on unit vectors (assignment by dot product). data: float32 (n, d).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        nonempty = counts > 0
+        norms = np.linalg.norm(sums[nonempty], axis=1, keepdims=True)
+        centroids[nonempty] = sums[nonempty] / np.maximum(norms, 1e-12)
+    return centroids
+
+class EmbeddingIndex:
+    """
+    Append-only float16 matrix on disk (np.memmap, grown by doubling) plus an optional IVF index.
+    Rows are claimed in SQLite, so several workers can append to the shared file; within a
+    process one writer (the indexer thread or the CLI), searches run concurrently with appends.
+    """
+    def __init__(self, path=EMBEDDINGS_PATH, dim=EMBEDDING_DIM, ivf_threshold=IVF_THRESHOLD, nprobe=IVF_NPROBE):
+        self.path = path
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        # A crash between claiming a row and writing it leaves a zero vector (scores 0), never a mismatch
+        self.count, self.hashes = get_embedding_state()
+        capacity = os.path.getsize(path) // (dim * 2) if os.path.exists(path) else 0
+        self._matrix = self._open(max(capacity, self.count, 1024))
+        self.ivf = self._load_ivf()
+        self._building = False
+        self.searches = 0
+
+    # --- Storage ---
+
+    def _open(self, capacity):
+        mode = "r+" if os.path.exists(self.path) else "w+"
+        if mode == "r+" and os.path.getsize(self.path) < capacity * self.dim * 2:
+            with open(self.path, "r+b") as f:
+                f.truncate(capacity * self.dim * 2)
+        return np.memmap(self.path, dtype=np.float16, mode=mode, shape=(capacity, self.dim))
+
+    def add(self, image_hash, vector, label=None, confidence=None, report_id=None):
+        """
+        Appends one vector; returns its row, or None if the image is already indexed.
+        """
+        with self._lock:
+            if image_hash in self.hashes:
+                return None
+            # Claim the row first: other workers append to the same matrix
+            row = claim_embedding_row(image_hash, label, confidence, report_id)
+            if row is None:
+                return None
+            if row >= len(self._matrix):
+                capacity = len(self._matrix)
+                while capacity <= row:
+                    capacity *= 2
+                self._matrix.flush()
+                self._matrix = self._open(capacity)
+            self._matrix[row] = vector
+            self._matrix.flush()
+            self.hashes.add(image_hash)
+            # Rows other workers claimed below ours become searchable too (the file is shared)
+            self.count = max(self.count, row + 1)
+            return row
+
+    # --- IVF ---
+
+    def _ivf_path(self):
+        return self.path + ".ivf.npz"
+
+    def _load_ivf(self):
+        try:
+            data = np.load(self._ivf_path())
+            return {key: data[key] for key in ("centroids", "order", "offsets")} | {"rows": int(data["rows"])}
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def build_ivf(self, nlist=None, sample_size=50000, iters=10):
+        """
+        Spherical k-means lists over the current rows. nlist defaults to ~4*sqrt(rows), capped at
+        1024 and never more than the rows.
+        """
+        rows = self.count
+        if rows == 0:
+            return None
+        start = time.perf_counter()
+        nlist = min(nlist or int(min(1024, max(1, 4 * np.sqrt(rows)))), rows)
+        rng = np.random.default_rng(0)
+        sample_idx = np.sort(rng.choice(rows, min(rows, max(sample_size, nlist)), replace=False))
+        centroids = _spherical_kmeans(self._matrix[sample_idx].astype(np.float32), nlist, iters)
+
+        assign = _assign(self._matrix[:rows], centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+
+        np.savez(self._ivf_path(), centroids=centroids, order=order, offsets=offsets, rows=rows)
+        self.ivf = {"centroids": centroids, "order": order, "offsets": offsets, "rows": rows}
+        logger.info(f"Built IVF index: {rows} rows, {nlist} lists in {time.perf_counter() - start:.1f}s")
+        return self.ivf
+
+    def _maybe_rebuild(self):
+        # Background rebuild when the corpus has outgrown the index; searches keep working meanwhile
+        ivf = self.ivf
+        stale = ivf is None or self.count - ivf["rows"] > IVF_REBUILD_GROWTH * ivf["rows"]
+        if stale and not self._building:
+            self._building = True
+            def run():
+                try:
+                    self.build_ivf()
+                except Exception as e:
+                    logger.error(f"IVF build failed: {e}")
+                finally:
+                    self._building = False
+            threading.Thread(target=run, name="ivf-build", daemon=True).start()
+
+    # --- Search ---
+
+    def _scan(self, query, rows):
+        """
+        Scores for matrix rows [lo, hi) or an index array, in float32 chunks.
+        """
+        if isinstance(rows, tuple):
+            lo, hi = rows
+            scores = np.empty(hi - lo, dtype=np.float32)
+            for start in range(lo, hi, SEARCH_CHUNK_ROWS):
+                end = min(hi, start + SEARCH_CHUNK_ROWS)
+                scores[start - lo:end - lo] = self._matrix[start:end].astype(np.float32) @ query
+            return np.arange(lo, hi), scores
+        rows = np.sort(rows)
+        return rows, self._matrix[rows].astype(np.float32) @ query
+
+    def search(self, vector, k=10, exact=None):
+        """
+        Top-k rows by cosine similarity. Returns (rows, scores, mode).
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        count = self.count
+        self.searches += 1
+        use_ivf = not exact and count > self.ivf_threshold
+        if use_ivf:
+            self._maybe_rebuild()
+        ivf = self.ivf if use_ivf else None
+
+        if ivf is None:
+            rows, scores = self._scan(query, (0, count))
+            mode = "exact"
+        else:
+            probe = np.argsort(ivf["centroids"] @ query)[::-1][:self.nprobe]
+            candidates = np.concatenate([ivf["order"][ivf["offsets"][c]:ivf["offsets"][c + 1]] for c in probe])
+            rows, scores = self._scan(query, candidates)
+            tail_rows, tail_scores = self._scan(query, (ivf["rows"], count))
+            rows, scores = np.concatenate([rows, tail_rows]), np.concatenate([scores, tail_scores])
+            mode = "ivf"
+
+        if len(rows) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(scores)[::-1]
+        return rows[order], scores[order], mode
+
+    def stats(self):
+        return {
+            "rows": self.count,
+            "capacity": len(self._matrix),
+            "ivf_rows": self.ivf["rows"] if self.ivf else None,
+            "ivf_lists": len(self.ivf["centroids"]) if self.ivf else None,
+            "searches": self.searches
+        }
+
+class EmbeddingIndexer:
+    """
+    Best-effort background indexing: analysed images are queued and embedded by a
+    single thread (the only writer to the matrix). A full queue drops the image.
+    """
+    def __init__(self, index, extractor, max_queue=256):
+        self.index = index
+        self.extractor = extractor
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.indexed = 0
+        self.dropped = 0
+        threading.Thread(target=self._run, name="embedding-indexer", daemon=True).start()
+
+    def submit(self, image_bytes, label=None, confidence=None, report_id=None):
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        if image_hash in self.index.hashes:
+            return
+        try:
+            self._queue.put_nowait((image_hash, image_bytes, label, confidence, report_id))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            image_hash, image_bytes, label, confidence, report_id = self._queue.get()
+            try:
+                vector = self.extractor.embed_bytes(image_bytes)
+                if vector is not None and self.index.add(image_hash, vector, label, confidence, report_id) is not None:
+                    self.indexed += 1
+            except Exception as e:
+                logger.error(f"Embedding failed: {e}")
+
+    def stats(self):
+        return {**self.index.stats(), "indexed": self.indexed, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+def _create_indexer():
+    return EmbeddingIndexer(EmbeddingIndex(), EmbeddingExtractor())
+
+# Only registered when enabled, so the startup warm-up never tries to load torch otherwise
+if EMBEDDINGS_ENABLED:
+    registry.register("embedding_indexer", _create_indexer)
+
+def get_indexer():
+    return registry.get("embedding_indexer")
+
+def similar_cases(image_bytes, k=10):
+    """
+    Top-k most similar indexed tongue images to the upload, with their stored metadata.
+    """
+    indexer = get_indexer()
+    vector = indexer.extractor.embed_bytes(image_bytes)
+    if vector is None:
+        return None
+    start = time.perf_counter()
+    rows, scores, mode = indexer.index.search(vector, k)
+    search_ms = (time.perf_counter() - start) * 1000
+    meta = get_embeddings([int(r) for r in rows])
+    return {
+        "mode": mode,
+        "search_ms": round(search_ms, 2),
+        "indexed": indexer.index.count,
+        "matches": [{**meta.get(int(r), {"id": int(r)}), "similarity": round(float(s), 4)}
+                    for r, s in zip(rows, scores)]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AyurAI tongue embedding index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="(Re)build the IVF index")
+    build.add_argument("--nlist", type=int)
+    sub.add_parser("stats")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    init_db()  # a fresh checkout has no embeddings table yet
+    index = EmbeddingIndex()
+    if args.command == "build":
+        index.build_ivf(args.nlist)
+    print(index.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+import struct
+
+# libjpeg can scale by 1/2, 1/4, 1/8 while decoding (IDCT scaling) - far cheaper than decode + resize
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# SOF markers carry the frame size (C4, C8 and CC are DHT/JPG/DAC, not frames)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def jpeg_dimensions(data):
+    """
+    Reads (height, width) from the JPEG frame header without decoding.
+    Returns None for non-JPEG or truncated data.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    i, n = 2, len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # standalone markers
+            i += 2
+            continue
+        (length,) = struct.unpack_from(">H", data, i + 2)
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return height, width
+        i += 2 + length
+    return None
+
+def choose_reduction(dimensions, min_side):
+    """
+    Largest decode scale (1, 2, 4 or 8) that keeps the shorter side >= min_side.
+    """
+    if dimensions is None:
+        return 1
+    short_side = min(dimensions)
+    for factor in (8, 4, 2):
+        if short_side // factor >= min_side:
+            return factor
+    return 1
+
+def decode_reduced(data, min_side, max_factor=8):
+    """
+    Decodes an image at the smallest JPEG scale whose shorter side is still >= min_side.
+    Non-JPEG input is decoded at full size. Returns (image, factor); image is None on failure.
+    """
+    factor = min(choose_reduction(jpeg_dimensions(data), min_side), max_factor)
+    nparr = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(nparr, REDUCED_COLOR_FLAGS[factor])
+    return img, factor
@@ -0,0 +1,169 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger("AyurAI.Admission")
+
+# Generations sent to Ollama at once; match OLLAMA_NUM_PARALLEL
+LLM_CONCURRENCY = int(os.getenv("AYURAI_LLM_CONCURRENCY", "2"))
+# Requests allowed to wait for a slot; beyond this they fall back immediately
+LLM_QUEUE_SIZE = int(os.getenv("AYURAI_LLM_QUEUE_SIZE", "32"))
+
+# Lower is served first
+PRIORITY_CHAT = 0
+PRIORITY_REPORT = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_CHAT: "chat", PRIORITY_REPORT: "report", PRIORITY_BACKGROUND: "background"}
+
+# Seconds from submission after which a request still waiting is dropped unsent
+DEADLINES = {
+    PRIORITY_CHAT: float(os.getenv("AYURAI_LLM_CHAT_DEADLINE", "15")),
+    PRIORITY_REPORT: float(os.getenv("AYURAI_LLM_REPORT_DEADLINE", "20")),
+    PRIORITY_BACKGROUND: float(os.getenv("AYURAI_LLM_BACKGROUND_DEADLINE", "300")),
+}
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason):
+        super().__init__(f"LLM request not admitted: {reason}")
+        self.reason = reason  # "queue full" | "shed" | "deadline"
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "deadline", "future", "enqueued")
+
+    def __init__(self, priority, seq, deadline):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class AdmissionController:
+    """
+    At most `limit` generations in flight; the rest wait in a priority queue (chat before
+    reports before background enrichment, FIFO within a priority) of at most `max_queue`.
+    A full queue sheds its least urgent waiter for a more urgent newcomer, otherwise rejects
+    the newcomer. Waiters past their deadline are dropped before they are sent.
+    Rejections raise AdmissionRejected, which callers turn into the rule-based fallback.
+    """
+    def __init__(self, limit=LLM_CONCURRENCY, max_queue=LLM_QUEUE_SIZE):
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._heap = []  # waiters; removed ones (future done) are skipped lazily
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.expired = 0
+        self._waits = deque(maxlen=1000)  # seconds waited, recent admissions
+
+    def deadline(self, priority, timeout=None):
+        return time.monotonic() + (DEADLINES[priority] if timeout is None else timeout)
+
+    async def acquire(self, priority, deadline):
+        now = time.monotonic()
+        if deadline <= now:
+            self.expired += 1
+            raise AdmissionRejected("deadline")
+        if self.active < self.limit and not self.queued:
+            self._admit(priority, 0.0)
+            return
+        if self.queued >= self.max_queue:
+            victim = self._least_urgent()
+            if victim is None or victim.priority <= priority:
+                self.rejected += 1
+                raise AdmissionRejected("queue full")
+            self._remove(victim, AdmissionRejected("shed"))
+            self.shed += 1
+
+        waiter = _Waiter(priority, next(self._seq), deadline)
+        self._heap.append(waiter)
+        self._heap.sort()
+        self.queued += 1
+        try:
+            await asyncio.wait({waiter.future}, timeout=deadline - now)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.exception():
+                self.release()  # granted just as the caller went away
+            elif not waiter.future.done():
+                self._remove(waiter)
+            raise
+        if not waiter.future.done():
+            self._remove(waiter, AdmissionRejected("deadline"))
+            self.expired += 1
+        waiter.future.result()  # raises if shed or expired
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority, deadline=None):
+        await self.acquire(priority, deadline or self.deadline(priority))
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _admit(self, priority, waited):
+        self.active += 1
+        self.admitted += 1
+        self._waits.append(waited)
+
+    def _wake(self):
+        now = time.monotonic()
+        while self.active < self.limit and self._heap:
+            waiter = self._heap.pop(0)
+            if waiter.future.done():
+                continue
+            self.queued -= 1
+            if waiter.deadline <= now:
+                # Its caller has stopped waiting for an answer: never send it
+                waiter.future.set_exception(AdmissionRejected("deadline"))
+                self.expired += 1
+                continue
+            self._admit(waiter.priority, now - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _least_urgent(self):
+        pending = [w for w in self._heap if not w.future.done()]
+        return max(pending) if pending else None
+
+    def _remove(self, waiter, error=None):
+        self.queued -= 1
+        if error is None:
+            waiter.future.cancel()
+        else:
+            waiter.future.set_exception(error)
+        self._heap = [w for w in self._heap if not w.future.done()]
+
+    def stats(self):
+        waits = sorted(self._waits)
+        by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for waiter in self._heap:
+            if not waiter.future.done():
+                by_priority[PRIORITY_NAMES[waiter.priority]] += 1
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_by_priority": by_priority,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "expired": self.expired,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0,
+                "p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0,
+                "max": round(waits[-1] * 1000, 1) if waits else 0
+            }
+        }
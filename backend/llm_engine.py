@@ -1,25 +1,186 @@
-import requests
+import asyncio
+import hashlib
+import httpx
 import json
 import logging
+import os
+import time
+from result_cache import ResultCache
+from llm_admission import AdmissionController, AdmissionRejected, PRIORITY_CHAT, PRIORITY_REPORT
+
+LLM_BASE_URL = os.getenv("AYURAI_OLLAMA_URL", "http://localhost:11434")
+LLM_MODEL = os.getenv("AYURAI_LLM_MODEL", "llama3")
+LLM_MAX_CONNECTIONS = int(os.getenv("AYURAI_LLM_MAX_CONNECTIONS", "16"))
+LLM_HEALTH_INTERVAL = float(os.getenv("AYURAI_LLM_HEALTH_INTERVAL", "10"))
+LLM_HEALTH_TIMEOUT = 2.0
+# How long Ollama keeps the model (and its KV cache) loaded after a request
+LLM_KEEP_ALIVE = os.getenv("AYURAI_LLM_KEEP_ALIVE", "30m")
+
+# Blocking generations keep the previous 30 s budget
+LLM_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+# Streaming generations: connect quickly, but allow long gaps between tokens on a busy CPU
+STREAM_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=5.0)
+
+# Bump when the report prompt changes - invalidates cached reports
+REPORT_PROMPT_VERSION = "1"
+
+# Generated reports keyed by canonical inference inputs + model (see precompute_reports.py).
+# In-process LRU; AYURAI_REPORT_CACHE_DB=<path> adds an SQLite tier shared by workers (off by default).
+report_cache = ResultCache(
+    max_bytes=int(os.getenv("AYURAI_REPORT_CACHE_BYTES", str(8 * 1024 * 1024))),
+    ttl=int(os.getenv("AYURAI_REPORT_CACHE_TTL", str(7 * 24 * 3600))),
+    disk_path=os.getenv("AYURAI_REPORT_CACHE_DB") or None,
+    disk_max_entries=int(os.getenv("AYURAI_REPORT_CACHE_ENTRIES", "10000"))
+)
+
+def canonical_report_inputs(diagnosis, symptoms, scores, contradictions):
+    """
+    Order-independent form of the report inputs; the prompt is built from this,
+    so equal keys always mean equal prompts.
+    """
+    return {
+        "diagnosis": diagnosis,
+        "symptoms": sorted(set(symptoms)),
+        "scores": {dosha: int(scores[dosha]) for dosha in sorted(scores)},
+        "contradictions": sorted(set(contradictions))
+    }
+
+class LLMUnavailable(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open, calls fail fast
+    (rule-based fallback) instead of waiting on a dead server. After `reset_timeout`
+    seconds one trial call is let through (half-open): allow() grants it to a single
+    caller until that call records its outcome (or release() if it ended without one);
+    success closes the breaker.
+    """
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.half_open_trial = False  # the one half-open call is in flight
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def available(self):
+        """
+        Whether a call would be allowed now, without claiming the half-open trial.
+        """
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.half_open_trial)
+
+    def allow(self):
+        """
+        Claims permission for one call, right before sending it.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.half_open_trial:
+            self.half_open_trial = True
+            return True
+        return False
+
+    def release(self):
+        # The trial call ended without an outcome (cancelled, never sent)
+        self.half_open_trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_trial = False
+
+    def record_failure(self):
+        self.half_open_trial = False
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state == "closed":
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+def parse_report(text):
+    """
+    The report prompt asks for JSON (format="json"); returns a dict or None.
+    """
+    if isinstance(text, dict):
+        return text
+    try:
+        result = json.loads(text) if text else None
+    except (TypeError, ValueError):
+        return None
+    return result if isinstance(result, dict) else None
+
+class GenerationStats:
+    """
+    Time-to-first-token and decode rate for one streamed generation.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+        self.eval_count = None
+        self.eval_duration_ns = None
+        self.prompt_eval_count = None
+        self.prompt_eval_duration_ns = None
+        self.context = None  # Ollama's token context after the answer (chat sessions)
+
+    def on_done(self, chunk):
+        # Ollama's final message: server-side timings and the conversation's token context
+        self.eval_count = chunk.get("eval_count")
+        self.eval_duration_ns = chunk.get("eval_duration")
+        self.prompt_eval_count = chunk.get("prompt_eval_count")
+        self.prompt_eval_duration_ns = chunk.get("prompt_eval_duration")
+        self.context = chunk.get("context")
+
+    def on_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        ttft = (self.first_token_at - self.started) if self.first_token_at else None
+        # Prefer the server's own decode timing (Ollama's final message); fall back to wall clock
+        if self.eval_count and self.eval_duration_ns:
+            rate = self.eval_count / (self.eval_duration_ns / 1e9)
+        elif ttft is not None and self.tokens > 1 and elapsed > ttft:
+            rate = (self.tokens - 1) / (elapsed - ttft)
+        else:
+            rate = None
+        return {
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "tokens": self.eval_count or self.tokens,
+            "tokens_per_second": round(rate, 1) if rate else None,
+            "prompt_tokens": self.prompt_eval_count,
+            "prompt_eval_ms": round(self.prompt_eval_duration_ns / 1e6, 1) if self.prompt_eval_duration_ns else None,
+            "total_ms": round(elapsed * 1000, 1)
+        }
 
 class LLMEngine:
-    def __init__(self, model="llama3", base_url="http://localhost:11434"):
+    def __init__(self, model=LLM_MODEL, base_url=LLM_BASE_URL):
         self.model = model
         self.base_url = base_url
         self.logger = logging.getLogger("AyurAI.LLM")
+        self._client = None
+        self._health_task = None
+        self.breaker = CircuitBreaker()
+        self.admission = AdmissionController()  # concurrency limit + priority queue in front of Ollama
+        self.healthy = None  # None until the first background probe
+        self._inflight = {}  # payload hash -> generation task (single-flight)
+        self.generate_calls = 0
+        self.coalesced_calls = 0
+        self.last_health_check = None
 
-    def check_connection(self):
-        try:
-            requests.get(f"{self.base_url}/api/tags")
-            return True
-        except requests.exceptions.ConnectionError:
-            return False
-
-    def generate_report(self, diagnosis, symptoms, scores, contradictions):
-        if not self.check_connection():
-            return None # Fallback to rule-based
-
-        prompt = f"""
+    def report_prompt(self, diagnosis, symptoms, scores, contradictions):
+        return f"""
         You are an expert Ayurvedic Physician (Vaidya) with 30 years of experience.
         Analyze the following bio-data and generate a personalized clinical report.
         
@@ -46,30 +207,9 @@ class LLMEngine:
            - "confidence_score" (integer)
            - "analysis_depth" (string)
         """
-        
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "format": "json",
-                    "stream": False
-                },
-                timeout=30
-            )
-            response.raise_for_status()
-            return response.json().get("response")
-        except Exception as e:
-            self.logger.error(f"LLM Generation failed: {e}")
-            return None
 
-
-    def chat_with_context(self, history, message, context):
-        if not self.check_connection():
-            return "I apologize, but I am currently unable to access my medical knowledge base. Please try again later."
-
-        system_prompt = f"""
+    def chat_system_prompt(self, context):
+        return f"""
         You are an expert Ayurvedic Physician (Vaidya).
         
         **Context:**
@@ -82,30 +222,315 @@ class LLMEngine:
         2. Keep answers concise, empathetic, and holistic.
         3. Do not give pharmaceutical advice. Stick to lifestyle, diet, and Ayurvedic herbs.
         """
-        
+
+    def chat_prompt(self, history, message, context):
+        system_prompt = self.chat_system_prompt(context)
+
         # Build conversation format for Ollama (Llama3-style)
         prompt = f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{system_prompt}<|eot_id|>"
-        
+        if context.get('summary'):
+            prompt += f"<|start_header_id|>system<|end_header_id|>\n\nEarlier in this conversation: {context['summary']}<|eot_id|>"
+
         for msg in history:
             role = "user" if msg['role'] == 'user' else "assistant"
             prompt += f"<|start_header_id|>{role}<|end_header_id|>\n\n{msg['content']}<|eot_id|>"
             
         prompt += f"<|start_header_id|>user<|end_header_id|>\n\n{message}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+        return prompt
 
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=30
+    def session_chat_payload(self, history, message, context):
+        """
+        Templated (not raw) payload for a chat session: Ollama applies the model's chat
+        template to `system` + `prompt` and returns the token `context`, which the next
+        turns continue from. Raw prompts get no context back.
+        """
+        system = self.chat_system_prompt(context)
+        if context.get('summary'):
+            system += f"\nEarlier in this conversation: {context['summary']}\n"
+        transcript = "".join(f"{'Patient' if m['role'] == 'user' else 'Vaidya'}: {m['content']}\n" for m in history)
+        prompt = f"Conversation so far:\n{transcript}\nPatient: {message}" if transcript else message
+        return {"system": system, "prompt": prompt}
+
+    # --- Connection pool and health ---
+
+    @property
+    def client(self):
+        # One pooled keep-alive client for every call; created on first use inside the event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_CONNECTIONS, keepalive_expiry=60)
             )
+        return self._client
+
+    async def start(self):
+        """
+        Starts the background health probe (call from the app's startup event).
+        """
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def check_connection(self):
+        # Reachability only: the breaker follows generation outcomes, which /api/tags
+        # answering says nothing about
+        try:
+            response = await self.client.get("/api/tags", timeout=LLM_HEALTH_TIMEOUT)
             response.raise_for_status()
-            return response.json().get("response")
+            return True
+        except httpx.HTTPError:
+            return False
+
+    async def _health_loop(self):
+        while True:
+            self.healthy = await self.check_connection()
+            self.last_health_check = time.time()
+            await asyncio.sleep(LLM_HEALTH_INTERVAL)
+
+    def is_available(self):
+        # Cached state: no round-trip on the request path
+        return self.healthy is not False and self.breaker.available()
+
+    async def _generate(self, payload, priority=PRIORITY_REPORT):
+        """
+        Single-flight: concurrent calls with an identical payload (same model, prompt and
+        options) share one in-flight request and all receive its result (or its error).
+        Returns Ollama's full response body (`response`, `context`, timings), or None if the
+        server is down or the admission queue turned the request away (rule-based fallback).
+        """
+        if not self.is_available():
+            return None
+        deadline = self.admission.deadline(priority)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        self.generate_calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._post_generate(payload, priority, deadline))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced_calls += 1
+        try:
+            # shield: a caller that disconnects must not cancel the generation other callers await
+            return await asyncio.shield(task)
+        except (AdmissionRejected, LLMUnavailable) as e:
+            self.logger.warning(f"{e}; using fallback")
+            return None
+
+    def _forget(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved even if every caller went away
+
+    def _claim_breaker(self):
+        """
+        Right before sending: while half-open only the caller that claims the trial goes
+        through. Returns whether this call is that trial.
+        """
+        trial = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            raise LLMUnavailable("LLM circuit breaker is open")
+        return trial
+
+    async def _post_generate(self, payload, priority, deadline):
+        async with self.admission.slot(priority, deadline):
+            trial = self._claim_breaker()
+            try:
+                response = await self.client.post("/api/generate", json={"keep_alive": LLM_KEEP_ALIVE, **payload})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                if trial:
+                    self.breaker.release()
+                raise
+        self.breaker.record_success()
+        return response.json()
+
+    # --- Report cache ---
+
+    def report_key(self, inputs):
+        payload = json.dumps(inputs, sort_keys=True).encode()
+        return ResultCache.key(payload, f"{REPORT_PROMPT_VERSION}:{self.model}")
+
+    async def cached_report(self, key):
+        return await asyncio.to_thread(report_cache.get, key)
+
+    async def store_report(self, key, result):
+        await asyncio.to_thread(report_cache.put, key, result)
+
+    async def generate_report(self, diagnosis, symptoms, scores, contradictions, priority=PRIORITY_REPORT):
+        inputs = canonical_report_inputs(diagnosis, symptoms, scores, contradictions)
+        key = self.report_key(inputs)
+        cached = await self.cached_report(key)
+        if cached is not None:
+            return cached
+
+        prompt = self.report_prompt(**inputs)
+        try:
+            result = parse_report((await self._generate({
+                "model": self.model,
+                "prompt": prompt,
+                "format": "json",
+                "stream": False
+            }, priority) or {}).get("response"))  # None -> fallback to rule-based
+        except Exception as e:
+            self.logger.error(f"LLM Generation failed: {e}")
+            return None
+        if result:
+            await self.store_report(key, result)
+        return result
+
+    async def chat_with_context(self, history, message, context):
+        if not self.is_available():
+            return "I apologize, but I am currently unable to access my medical knowledge base. Please try again later."
+
+        prompt = self.chat_prompt(history, message, context)
+
+        try:
+            response = (await self._generate({
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False
+            }, PRIORITY_CHAT) or {}).get("response")
+            return response or "I am having trouble connecting to my thought process right now."
         except Exception as e:
             self.logger.error(f"LLM Chat generation failed: {e}")
             return "I am having trouble connecting to my thought process right now."
 
+    def stream_generate(self, prompt, stats=None, format=None, priority=PRIORITY_CHAT):
+        payload = {"prompt": prompt}
+        if format:
+            payload["format"] = format
+        return self.stream_payload(payload, stats, priority)
+
+    async def stream_payload(self, payload, stats=None, priority=PRIORITY_CHAT):
+        """
+        Relays an Ollama /api/generate stream: yields text chunks (~one token each) as they arrive.
+        Closing the generator (client went away) closes the HTTP stream, which stops generation
+        server-side. Holds an admission slot for the whole stream; raises AdmissionRejected
+        if none is free in time.
+        """
+        if not self.is_available():
+            raise LLMUnavailable("LLM server is unavailable")
+        stats = stats or GenerationStats()
+        payload = {"model": self.model, "keep_alive": LLM_KEEP_ALIVE, **payload, "stream": True}
+        async with self.admission.slot(priority):
+            trial = self._claim_breaker()
+            try:
+                async with self.client.stream("POST", "/api/generate", json=payload, timeout=STREAM_TIMEOUT) as response:
+                    response.raise_for_status()
+                    self.breaker.record_success()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise RuntimeError(chunk["error"])
+                        token = chunk.get("response")
+                        if token:
+                            stats.on_token()
+                            yield token
+                        if chunk.get("done"):
+                            stats.on_done(chunk)
+                            break
+            except httpx.HTTPError:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                if trial:
+                    self.breaker.release()
+                raise
+
+    def stream_report(self, inputs, stats=None):
+        """
+        Streams the report for canonical inputs (see canonical_report_inputs).
+        """
+        return self.stream_generate(self.report_prompt(**inputs), stats, format="json", priority=PRIORITY_REPORT)
+
+    def stream_chat(self, history, message, context, stats=None):
+        return self.stream_generate(self.chat_prompt(history, message, context), stats)
+
+    # --- Server-side chat sessions (chat_sessions.py) ---
+
+    async def session_payload(self, session, message):
+        return session.continue_payload(message) or await session.rebuild_payload(self, message)
+
+    async def session_chat(self, session, message):
+        """
+        One turn of a server-side conversation; returns (answer, generation stats).
+        The caller holds session.lock.
+        """
+        stats = GenerationStats()
+        payload = await self.session_payload(session, message)
+        try:
+            body = await self._generate({"model": self.model, **payload, "stream": False}, PRIORITY_CHAT)
+        except Exception as e:
+            self.logger.error(f"LLM Chat generation failed: {e}")
+            body = None
+        if not body or not body.get("response"):
+            # Nothing recorded: the next turn retries from the same state
+            return None, stats
+        stats.on_done(body)
+        session.record(message, body["response"], stats.context)
+        return body["response"], stats
+
+    async def stream_session_chat(self, session, message, stats):
+        """
+        Streamed session turn; the turn is recorded only if the answer completes.
+        The caller holds session.lock.
+        """
+        payload = await self.session_payload(session, message)
+        chunks = []
+        async for token in self.stream_payload(payload, stats):
+            chunks.append(token)
+            yield token
+        session.record(message, "".join(chunks), stats.context)
+
+    async def summarize_conversation(self, summary, messages):
+        """
+        Folds messages trimmed off a chat session's prompt into its running summary.
+        None if the model is unavailable (the caller keeps the previous summary).
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = f"""
+        Summarize this part of a conversation between a patient and an Ayurvedic physician
+        in at most 3 sentences. Keep symptoms, advice given and open questions.
+        {f"Summary of what came before: {summary}" if summary else ""}
+
+        {transcript}
+        """
+        try:
+            body = await self._generate({"model": self.model, "prompt": prompt, "stream": False}, PRIORITY_CHAT)
+        except Exception as e:
+            self.logger.error(f"Chat summary failed: {e}")
+            return None
+        return ((body or {}).get("response") or "").strip() or None
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "healthy": self.healthy,
+            "last_health_check": self.last_health_check,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "consecutive_failures": self.breaker.failures,
+            "generations_in_flight": len(self._inflight),
+            "admission": self.admission.stats(),
+            "generate_calls": self.generate_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "coalescing_ratio": round(self.coalesced_calls / self.generate_calls, 3) if self.generate_calls else 0
+        }
+
 llm = LLMEngine()
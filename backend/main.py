@@ -1,14 +1,35 @@
+import time
+_startup_begin = time.perf_counter()
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import logging
 from database import init_db
+from llm_engine import llm
+from model_registry import registry
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+registry.record_import("main:framework", time.perf_counter() - _startup_begin)
 
 # Import Routers
+# (vitals/vision import cv2, SciPy and the models on first use; see model_registry)
+_routers_begin = time.perf_counter()
 from routers import vitals, vision, diagnostics, system, auth
+registry.record_import("main:routers", time.perf_counter() - _routers_begin)
+
+# Heavy modules imported (and their models loaded) in the background after startup.
+# For a per-module breakdown run: python -X importtime main.py
+# With AYURAI_VISION_WORKERS set, the vision models load in the worker processes only.
+from vision_pool import VISION_WORKERS
+from embedding_index import EMBEDDINGS_ENABLED
+WARMUP_MODULES = ["rppg", "vision_pool" if VISION_WORKERS else "vision"]
+WARMUP_MODELS = ["vision_pool"] if VISION_WORKERS else None
+if EMBEDDINGS_ENABLED:
+    WARMUP_MODULES.append("embedding_index")
+    if WARMUP_MODELS is not None:
+        WARMUP_MODELS.append("embedding_indexer")
 
 # ... (rest of imports)
 
@@ -47,8 +68,27 @@ app.add_middleware(
 @app.on_event("startup")
 def startup_event():
     init_db()
+    # Serve immediately; /api/system/health reports models_ready once warm-up completes
+    registry.start_warmup(WARMUP_MODULES, WARMUP_MODELS)
+    registry.record_import("main:startup_total", time.perf_counter() - _startup_begin)
     logger.info("AyurAI Engine Started")
 
+@app.on_event("startup")
+async def start_llm():
+    # Background Ollama health probe; requests read the cached state
+    await llm.start()
+
+@app.on_event("shutdown")
+async def stop_llm():
+    await llm.close()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Stop the vision worker processes, if they were started
+    if registry.status().get("vision_pool", {}).get("state") == "ready":
+        from vision_pool import get_pool
+        get_pool().shutdown()
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     # Dont catch RateLimitExceeded here, let slowapi handle it
@@ -26,6 +26,15 @@ class AyurVisionNet(nn.Module):
     def forward(self, x):
         return self.backbone(x)
 
+    def features(self, x):
+        """
+        2048-d pooled ResNet50 features (the input to the classifier head).
+        """
+        b = self.backbone
+        x = b.maxpool(b.relu(b.bn1(b.conv1(x))))
+        x = b.layer4(b.layer3(b.layer2(b.layer1(x))))
+        return torch.flatten(b.avgpool(x), 1)
+
 def load_model(model_path=None):
     """
     Loads the AyurVisionNet model.
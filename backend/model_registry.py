@@ -0,0 +1,107 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger("AyurAI.Models")
+
+class ModelRegistry:
+    """
+    Lazily constructed models and heavy modules.
+    Modules register a loader at import time; nothing is built until get() is called
+    or the background warm-up reaches it, so the API can start serving auth/history
+    traffic before cv2, SciPy or the vision models are loaded.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.import_profile = {}  # module/phase -> seconds
+        self.warmup_started = None
+        self.warmup_finished = None
+        self.warmup_targets = None  # None = every registered model
+
+    def register(self, name, loader):
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = {
+                    "loader": loader,
+                    "state": "pending",
+                    "value": None,
+                    "error": None,
+                    "load_seconds": None,
+                    "lock": threading.Lock(),
+                }
+
+    def get(self, name):
+        """
+        Returns the loaded model, building it on first use (blocks until ready).
+        """
+        entry = self._entries[name]
+        if entry["state"] == "ready":
+            return entry["value"]
+        with entry["lock"]:
+            if entry["state"] != "ready":
+                entry["state"] = "loading"
+                start = time.perf_counter()
+                try:
+                    entry["value"] = entry["loader"]()
+                    entry["state"] = "ready"
+                    entry["error"] = None
+                except Exception as e:
+                    entry["state"] = "failed"
+                    entry["error"] = str(e)
+                    logger.error(f"Failed to load {name}: {e}")
+                    raise
+                finally:
+                    entry["load_seconds"] = round(time.perf_counter() - start, 3)
+            return entry["value"]
+
+    def record_import(self, name, seconds):
+        self.import_profile[name] = round(seconds, 3)
+
+    def import_module(self, module_name):
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.record_import(module_name, time.perf_counter() - start)
+        return module
+
+    def warm_all(self, modules=(), models=None):
+        """
+        Imports the heavy modules (which register their models), then loads every model
+        (or only `models`, e.g. when the vision models live in worker processes instead).
+        """
+        self.warmup_started = time.time()
+        for module_name in modules:
+            try:
+                self.import_module(module_name)
+            except Exception as e:
+                logger.error(f"Warm-up import of {module_name} failed: {e}")
+        # Models registered later (optional features imported on first use) don't hold up readiness
+        self.warmup_targets = list(models) if models is not None else list(self._entries)
+        for name in self.warmup_targets:
+            try:
+                self.get(name)
+            except Exception:
+                pass  # already logged; the entry reports "failed"
+        self.warmup_finished = time.time()
+        logger.info(f"Model warm-up finished in {self.warmup_finished - self.warmup_started:.2f}s")
+
+    def start_warmup(self, modules=(), models=None):
+        thread = threading.Thread(target=self.warm_all, args=(modules, models), name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self):
+        # Ready once warm-up has run and nothing is still pending/loading
+        names = self.warmup_targets if self.warmup_targets is not None else list(self._entries)
+        return self.warmup_finished is not None and all(
+            self._entries[name]["state"] in ("ready", "failed") for name in names if name in self._entries)
+
+    def status(self):
+        return {
+            name: {"state": entry["state"], "load_seconds": entry["load_seconds"], "error": entry["error"]}
+            for name, entry in self._entries.items()
+        }
+
+# Global registry shared by routers and the startup warm-up
+registry = ModelRegistry()
@@ -0,0 +1,244 @@
+"""
+ONNX Runtime CPU backend for the vision models.
+
+Export / quantize (from backend/):
+    python -m onnx_backend export --model yolo --quantize dynamic
+    python -m onnx_backend export --model resnet --weights ayurvisionnet.pth --quantize static --calib-dir samples/
+Parity + latency against PyTorch:
+    python -m onnx_backend check --model yolo --onnx yolov8l-cls.int8.onnx --images samples/
+
+Serve it by setting AYURAI_VISION_BACKEND=onnx and AYURAI_ONNX_MODEL=<path>.
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("AyurAI.ONNX")
+
+ONNX_INTRA_OP_THREADS = int(os.getenv("AYURAI_ONNX_INTRA_OP_THREADS", "0"))  # 0 = ORT default (physical cores)
+ONNX_INTER_OP_THREADS = int(os.getenv("AYURAI_ONNX_INTER_OP_THREADS", "1"))
+
+# Input normalisation per exported model
+NORMALIZATION = {
+    "yolo": (np.zeros(3, np.float32), np.ones(3, np.float32)),  # ultralytics cls: RGB / 255
+    "imagenet": (np.array([0.485, 0.456, 0.406], np.float32), np.array([0.229, 0.224, 0.225], np.float32)),
+}
+
+def preprocess(images, imgsz=224, normalization="yolo"):
+    """
+    BGR uint8 images -> NCHW float32 batch: resize shorter side, center crop, RGB, normalise.
+    """
+    mean, std = NORMALIZATION[normalization]
+    batch = np.empty((len(images), 3, imgsz, imgsz), dtype=np.float32)
+    for i, img in enumerate(images):
+        h, w = img.shape[:2]
+        scale = imgsz / min(h, w)
+        resized = cv2.resize(img, (max(imgsz, round(w * scale)), max(imgsz, round(h * scale))),
+                             interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        top = (resized.shape[0] - imgsz) // 2
+        left = (resized.shape[1] - imgsz) // 2
+        crop = resized[top:top + imgsz, left:left + imgsz, ::-1].astype(np.float32) / 255.0
+        batch[i] = ((crop - mean) / std).transpose(2, 0, 1)
+    return batch
+
+def _as_probabilities(outputs):
+    # YOLO cls exports end in softmax; the ResNet head outputs logits
+    if np.all(outputs >= 0) and np.allclose(outputs.sum(axis=1), 1.0, atol=1e-3):
+        return outputs
+    shifted = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+class OnnxClassifier:
+    """
+    Drop-in for AyurYOLO (predict / predict_batch) served by ONNX Runtime on CPU.
+    Test-time augmentation is not available; `augment` is accepted and ignored.
+    """
+    def __init__(self, model_path, intra_op_threads=ONNX_INTRA_OP_THREADS,
+                 inter_op_threads=ONNX_INTER_OP_THREADS, imgsz=224, normalization="yolo"):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = imgsz
+        self.normalization = normalization
+        self.model_path = model_path
+        logger.info(f"Loaded ONNX model from {model_path} (intra={intra_op_threads}, inter={inter_op_threads})")
+
+    def predict_proba(self, images):
+        batch = preprocess(images, self.imgsz, self.normalization)
+        outputs = self.session.run(None, {self.input_name: batch})[0]
+        return _as_probabilities(outputs.reshape(len(images), -1))
+
+    def predict_batch(self, images, augment=None):
+        probs = self.predict_proba(images)
+        idx = probs.argmax(axis=1)
+        return [(float(probs[i, j]), int(j)) for i, j in enumerate(idx)]
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+# --- Export / quantization ---
+
+def export_yolo(model_path="yolov8l-cls.pt", imgsz=224):
+    from ultralytics import YOLO
+    return YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+def export_resnet(out_path="ayurvisionnet.onnx", weights_path=None, imgsz=224):
+    if not weights_path:
+        # Without a state dict load_model builds a fresh random head on every call
+        raise ValueError("ResNet export needs AyurVisionNet weights")
+    import torch
+    from model import load_model
+    model = load_model(weights_path)
+    dummy = torch.randn(1, 3, imgsz, imgsz)
+    torch.onnx.export(model, dummy, out_path, input_names=["images"], output_names=["logits"],
+                      dynamic_axes={"images": {0: "batch"}, "logits": {0: "batch"}}, opset_version=17)
+    return out_path
+
+class _CalibrationReader:
+    """
+    Feeds preprocessed sample images to the static quantizer.
+    """
+    def __init__(self, input_name, image_paths, imgsz, normalization):
+        self.input_name = input_name
+        self.paths = iter(image_paths)
+        self.imgsz = imgsz
+        self.normalization = normalization
+
+    def get_next(self):
+        for path in self.paths:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is not None:
+                return {self.input_name: preprocess([img], self.imgsz, self.normalization)}
+        return None
+
+def quantize(onnx_path, mode="dynamic", calibration_images=(), imgsz=224, normalization="yolo"):
+    """
+    int8 quantization. "dynamic" needs no data; "static" calibrates activations on sample images.
+    """
+    from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantType, QuantFormat
+    out_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    if mode == "dynamic":
+        quantize_dynamic(onnx_path, out_path, weight_type=QuantType.QInt8)
+    elif mode == "static":
+        if not calibration_images:
+            raise ValueError("Static quantization needs calibration images")
+        import onnxruntime as ort
+        input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        reader = _CalibrationReader(input_name, calibration_images, imgsz, normalization)
+        quantize_static(onnx_path, out_path, reader, quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return out_path
+
+# --- Parity / latency ---
+
+def _torch_proba(kind, imgsz, weights_path=None):
+    """
+    Reference probabilities from the PyTorch model (no TTA).
+    """
+    if kind == "yolo":
+        from ultralytics import YOLO
+        model = YOLO(weights_path or "yolov8l-cls.pt")
+        def run(batch_images):
+            results = model(batch_images, verbose=False, imgsz=imgsz)
+            return np.stack([r.probs.data.cpu().numpy() for r in results])
+        return run
+    if not weights_path:
+        raise ValueError("ResNet parity needs the AyurVisionNet weights the model was exported from")
+    import torch
+    from model import load_model
+    model = load_model(weights_path)
+    def run(batch_images):
+        with torch.no_grad():
+            logits = model(torch.from_numpy(preprocess(batch_images, imgsz, "imagenet"))).numpy()
+        return _as_probabilities(logits)
+    return run
+
+def _timed(fn, images, repeats):
+    fn(images)  # warm-up
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(images)
+        latencies.append((time.perf_counter() - start) * 1000 / len(images))
+    return {"ms_per_image_p50": round(float(np.median(latencies)), 2),
+            "ms_per_image_min": round(float(np.min(latencies)), 2)}
+
+def parity_check(kind, onnx_path, images, imgsz=224, weights_path=None, repeats=5):
+    """
+    Top-1 agreement, probability drift and per-image latency of ONNX vs PyTorch.
+    """
+    normalization = "yolo" if kind == "yolo" else "imagenet"
+    torch_run = _torch_proba(kind, imgsz, weights_path)
+    onnx_model = OnnxClassifier(onnx_path, imgsz=imgsz, normalization=normalization)
+
+    torch_probs = torch_run(images)
+    onnx_probs = onnx_model.predict_proba(images)
+    return {
+        "images": len(images),
+        "top1_agreement": float(np.mean(torch_probs.argmax(axis=1) == onnx_probs.argmax(axis=1))),
+        "max_abs_prob_diff": float(np.abs(torch_probs - onnx_probs).max()),
+        "latency": {
+            "torch": _timed(torch_run, images, repeats),
+            "onnx": _timed(onnx_model.predict_proba, images, repeats),
+        },
+    }
+
+def _load_images(directory, limit=64):
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.png")))[:limit]
+    return paths, [img for img in (cv2.imread(p, cv2.IMREAD_COLOR) for p in paths) if img is not None]
+
+def main():
+    parser = argparse.ArgumentParser(description="AyurAI ONNX export, quantization and parity check")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export")
+    export.add_argument("--model", choices=["yolo", "resnet"], default="yolo")
+    export.add_argument("--weights", help="yolo .pt or AyurVisionNet state dict")
+    export.add_argument("--out", default="ayurvisionnet.onnx", help="Output path (resnet)")
+    export.add_argument("--quantize", choices=["none", "dynamic", "static"], default="none")
+    export.add_argument("--calib-dir", help="Images for static quantization")
+    export.add_argument("--imgsz", type=int, default=224)
+
+    check = sub.add_parser("check")
+    check.add_argument("--model", choices=["yolo", "resnet"], default="yolo")
+    check.add_argument("--weights")
+    check.add_argument("--onnx", required=True)
+    check.add_argument("--images", required=True, help="Directory of sample images")
+    check.add_argument("--imgsz", type=int, default=224)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.model == "resnet" and not args.weights:
+        parser.error("--weights is required for --model resnet (otherwise the head is random)")
+
+    if args.command == "export":
+        if args.model == "yolo":
+            path = export_yolo(args.weights or "yolov8l-cls.pt", args.imgsz)
+        else:
+            path = export_resnet(args.out, args.weights, args.imgsz)
+        print(f"Exported {path}")
+        if args.quantize != "none":
+            calib = _load_images(args.calib_dir)[0] if args.calib_dir else ()
+            normalization = "yolo" if args.model == "yolo" else "imagenet"
+            print(f"Quantized {quantize(path, args.quantize, calib, args.imgsz, normalization)}")
+    else:
+        _, images = _load_images(args.images)
+        if not images:
+            parser.error(f"No images found in {args.images}")
+        import json
+        print(json.dumps(parity_check(args.model, args.onnx, images, args.imgsz, args.weights), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Warms the LLM report cache (llm_engine.report_cache) offline.
+
+Candidates, most valuable first:
+  1. symptom sets seen in past reports, by frequency (--from-history)
+  2. every pulse/questionnaire combination /api/diagnose can produce (--enumerate)
+Each is re-inferred with the current rules, so keys match what live requests compute.
+Reports land in the SQLite tier, so AYURAI_REPORT_CACHE_DB must point at the file the
+API workers use.
+
+Usage (from backend/, with Ollama running):
+    AYURAI_REPORT_CACHE_DB=/var/lib/ayurai/report_cache.db python -m precompute_reports --from-history 1000 --enumerate
+    AYURAI_REPORT_CACHE_DB=/var/lib/ayurai/report_cache.db python -m precompute_reports --enumerate --limit 20 --dry-run
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter
+
+from database import get_history
+from knowledge_base import expert
+from llm_engine import llm, report_cache, canonical_report_inputs
+from llm_admission import PRIORITY_BACKGROUND
+
+logger = logging.getLogger("AyurAI.Precompute")
+
+# The answers collect_symptoms() understands (None = not answered)
+PULSE_OPTIONS = [None, {"bpm": 95}, {"bpm": 55}]
+QUESTIONNAIRE_OPTIONS = {
+    "sleep": [None, "disturbed"],
+    "digestion": [None, "acidic", "bloating", "slow"],
+    "energy": [None, "high", "low", "variable"],
+}
+
+def history_symptom_sets(limit):
+    counts = Counter(tuple(sorted(set(report["symptoms"]))) for report in get_history(limit=limit))
+    return [list(symptoms) for symptoms, _ in counts.most_common()]
+
+def enumerated_symptom_sets():
+    from routers.diagnostics import DiagnosticRequest, collect_symptoms
+    keys = list(QUESTIONNAIRE_OPTIONS)
+    for pulse in PULSE_OPTIONS:
+        for answers in itertools.product(*(QUESTIONNAIRE_OPTIONS[k] for k in keys)):
+            questionnaire = {k: v for k, v in zip(keys, answers) if v is not None}
+            request = DiagnosticRequest(pulse=pulse, tongue=None, questionnaire=questionnaire or None)
+            yield collect_symptoms(request)
+
+def candidates(history_limit, enumerate_all):
+    """
+    Unique canonical report inputs, in priority order.
+    """
+    sources = []
+    if history_limit:
+        sources.append(history_symptom_sets(history_limit))
+    if enumerate_all:
+        sources.append(enumerated_symptom_sets())
+    seen = set()
+    for symptoms in itertools.chain(*sources):
+        diagnosis, scores, _, contradictions = expert.infer_dosha(symptoms)
+        inputs = canonical_report_inputs(diagnosis, symptoms, scores, contradictions)
+        key = llm.report_key(inputs)
+        if key not in seen:
+            seen.add(key)
+            yield key, inputs
+
+async def precompute(history_limit, enumerate_all, limit=None, dry_run=False):
+    summary = {"candidates": 0, "cached": 0, "generated": 0, "failed": 0}
+    start = time.perf_counter()
+    try:
+        for key, inputs in itertools.islice(candidates(history_limit, enumerate_all), limit):
+            summary["candidates"] += 1
+            if await llm.cached_report(key) is not None:
+                summary["cached"] += 1
+                continue
+            if dry_run:
+                continue
+            # Sequential on purpose: the local model serializes generations anyway
+            result = await llm.generate_report(inputs["diagnosis"], inputs["symptoms"],
+                                               inputs["scores"], inputs["contradictions"],
+                                               priority=PRIORITY_BACKGROUND)
+            summary["generated" if result else "failed"] += 1
+            logger.info(f"{inputs['diagnosis']} / {len(inputs['symptoms'])} symptoms: "
+                        f"{'ok' if result else 'failed'}")
+    finally:
+        await llm.close()
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute LLM diagnostic reports into the report cache")
+    parser.add_argument("--from-history", type=int, default=0, metavar="N",
+                        help="Use the symptom sets of the last N saved reports")
+    parser.add_argument("--enumerate", action="store_true", help="All pulse/questionnaire combinations")
+    parser.add_argument("--limit", type=int, help="Stop after this many candidates")
+    parser.add_argument("--dry-run", action="store_true", help="Only count candidates and cache hits")
+    args = parser.parse_args()
+    if not args.from_history and not args.enumerate:
+        parser.error("Pass --from-history N and/or --enumerate")
+    if not report_cache.disk_path:
+        parser.error("Set AYURAI_REPORT_CACHE_DB: without the disk tier precomputed reports are lost on exit")
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(precompute(args.from_history, args.enumerate, args.limit, args.dry_run)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger("AyurAI.Jobs")
+
+ENRICH_WORKERS = int(os.getenv("AYURAI_ENRICH_WORKERS", "2"))
+ENRICH_QUEUE_SIZE = int(os.getenv("AYURAI_ENRICH_QUEUE_SIZE", "100"))
+
+class Job:
+    def __init__(self, payload, owner=None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.owner = owner  # user id; other users cannot read the job
+        self.status = "queued"  # queued -> running -> done | failed; or rejected (queue full)
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        self.done.set()
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "queued_seconds": round((self.finished or time.time()) - self.created, 3)
+        }
+
+class JobQueue:
+    """
+    Bounded background work on the event loop: `workers` tasks drain a queue of at most
+    `max_queue` jobs, each running `handler(payload)`. A full queue rejects new jobs
+    immediately (the caller keeps its fallback result). Finished jobs stay pollable
+    until `keep` newer jobs have been submitted.
+    """
+    def __init__(self, handler, workers=ENRICH_WORKERS, max_queue=ENRICH_QUEUE_SIZE, keep=1000):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def ensure_started(self):
+        # Created on first use so the queue and tasks belong to the serving event loop
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    def submit(self, payload, owner=None):
+        self.ensure_started()
+        job = Job(payload, owner)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            self.jobs.popitem(last=False)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            job.finish("rejected", error="Enrichment queue is full")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                job.finish("done", await self.handler(job.payload))
+                self.completed += 1
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.finish("failed", error=str(e))
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("AyurAI.Cache")
+
+class ResultCache:
+    """
+    Content-addressed cache for JSON-serialisable results.
+    Keys are sha256(version + payload), so a new model or heuristic version never
+    sees old entries. In-process tier: LRU capped by total serialized size, with TTL.
+    Optional SQLite tier (disk_path) shared by all workers on the host, trimmed
+    least-recently-used first.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=24 * 3600, disk_path=None, disk_max_entries=50000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()  # key -> (serialized, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_writes = 0
+        if disk_path:
+            self._init_disk()
+
+    @staticmethod
+    def key(payload, version):
+        digest = hashlib.sha256(version.encode())
+        digest.update(payload)
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[0])
+            if entry:
+                self._remove(key)
+
+        serialized = self._disk_get(key, now) if self.disk_path else None
+        with self._lock:
+            if serialized is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, serialized, now)
+        return json.loads(serialized)
+
+    def put(self, key, value):
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._store(key, serialized, now)
+        if self.disk_path:
+            self._disk_put(key, serialized, now)
+
+    def _store(self, key, serialized, now):
+        if len(serialized) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (serialized, now)
+        self._bytes += len(serialized)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key):
+        serialized, _ = self._entries.pop(key)
+        self._bytes -= len(serialized)
+
+    # --- Disk tier ---
+
+    def _connect(self):
+        # Short-lived connections, as in database.py; WAL lets workers read while one writes
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_disk(self):
+        try:
+            conn = self._connect()
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL
+                )
+            ''')
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(result_cache)")]
+            if "accessed_at" not in columns:  # caches created before LRU trimming
+                conn.execute("ALTER TABLE result_cache ADD COLUMN accessed_at REAL")
+                conn.execute("UPDATE result_cache SET accessed_at = stored_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_stored ON result_cache(stored_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_accessed ON result_cache(accessed_at)")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Disk cache disabled: {e}")
+            self.disk_path = None
+
+    def _disk_get(self, key, now):
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, stored_at FROM result_cache WHERE key = ?", (key,)).fetchone()
+            fresh = row is not None and now - row[1] < self.ttl
+            if fresh:
+                conn.execute("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Disk cache read failed: {e}")
+            return None
+        return row[0] if fresh else None
+
+    def _disk_put(self, key, serialized, now):
+        try:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO result_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                         (key, serialized, now, now))
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 1:
+                # Every 100 writes: expire by TTL and trim the least recently used rows beyond the size cap
+                conn.execute("DELETE FROM result_cache WHERE stored_at < ?", (now - self.ttl,))
+                conn.execute('''
+                    DELETE FROM result_cache WHERE key IN (
+                        SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.disk_max_entries,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Disk cache write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0,
+                "disk_tier": bool(self.disk_path)
+            }
@@ -1,12 +1,24 @@
+import asyncio
+import json
+import logging
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from knowledge_base import expert
-from llm_engine import llm
-from database import save_report, get_history
+from llm_engine import llm, GenerationStats, parse_report, canonical_report_inputs
+from llm_admission import PRIORITY_BACKGROUND
+from database import save_report, update_report, get_history
+from report_jobs import JobQueue
+from chat_sessions import chat_sessions
 from dependencies import get_current_user
 
 router = APIRouter(prefix="/api", tags=["Diagnostics"])
+logger = logging.getLogger("AyurAI.Diagnostics")
+
+# Keep proxies (nginx) from buffering token streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 # --- Models ---
 
@@ -17,7 +29,10 @@ class DiagnosticRequest(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
-    history: List[Dict[str, str]] # [{'role': 'user', 'content': '...'}]
+    # Conversations are kept server-side: send the session_id from the previous answer
+    # instead of the history. history only seeds a new (or expired) session.
+    session_id: Optional[str] = None
+    history: List[Dict[str, str]] = [] # [{'role': 'user', 'content': '...'}]
     context: Optional[Dict[str, Any]] = {}
 
 # --- Helpers ---
@@ -31,127 +46,295 @@ def get_recommendations(imbalance):
         return ["Spicy, light foods", "Vigorous exercise", "Wake up early", "Ginger tea"]
     return ["Maintain balanced diet", "Yoga", "Pranayama"]
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def collect_symptoms(data):
+    symptoms = []
+
+    # 1. Pulse Analysis
+    if data.pulse:
+        bpm = data.pulse.get("bpm")
+        if bpm:
+            if bpm > 90: symptoms.append("High Heart Rate (Pitta/Vata)")
+            elif bpm < 60: symptoms.append("Low Heart Rate (Kapha)")
+
+    # 2. Tongue Analysis
+    if data.tongue and data.tongue.get("diagnosis"):
+        symptoms.extend(data.tongue["diagnosis"])
+
+    # 3. Questionnaire
+    if data.questionnaire:
+        q = data.questionnaire
+        if q.get("sleep") == "disturbed": symptoms.append("Disturbed Sleep (Vata)")
+        if q.get("digestion") == "acidic": symptoms.append("Acidic Digestion (Pitta)")
+        if q.get("digestion") == "bloating": symptoms.append("Bloating (Vata)")
+        if q.get("digestion") == "slow": symptoms.append("Slow Digestion (Kapha)")
+
+        if q.get("energy") == "high": symptoms.append("High Energy")
+        if q.get("energy") == "low": symptoms.append("Low Energy")
+        if q.get("energy") == "variable": symptoms.append("Variable Energy")
+    return symptoms
+
+def merge_llm_result(diagnosis, evidence, llm_result):
+    """
+    Report fields from the LLM result, or rule-based defaults when it is None.
+    """
+    # Default values
+    fields = {
+        "explanation": f"Primary imbalance detected as {diagnosis}. " + " | ".join(evidence),
+        "recommendations": get_recommendations(diagnosis),
+        "analysis_depth": "Rule-Based (Standard)",
+        "reasoning": "Diagnosis based on algorithmic rule matching of pulse rate and reported symptoms.",
+        "reference": "General Ayurvedic Principles",
+        "confidence_score": 75 # Default rule-based confidence
+    }
+
+    if llm_result:
+        fields["explanation"] = llm_result.get("explanation", fields["explanation"])
+        fields["recommendations"] = llm_result.get("recommendations", fields["recommendations"])
+        fields["analysis_depth"] = "Generative AI (Deep Analysis)"
+        fields["reasoning"] = llm_result.get("reasoning", fields["reasoning"])
+        fields["reference"] = llm_result.get("reference", fields["reference"])
+        fields["confidence_score"] = llm_result.get("confidence_score", 85)
+    return fields
+
+def stored_explanation(fields):
+    # Save to DB (Modified to include new fields in explanation for now, or just save standard)
+    # For this iteration, we might not change DB schema yet, but we return to frontend.
+    # We append reasoning to explanation for storage if DB is strict, or just pass it through.
+    return f"{fields['explanation']}\n\nReasoning: {fields['reasoning']}\nReference: {fields['reference']}"
+
+def report_response(report_id, diagnosis, scores, evidence, contradictions, fields):
+    """
+    The /api/diagnose response body for a saved report.
+    """
+    # Mock FHIR Report
+    fhir_report = {
+        "resourceType": "Composition",
+        "id": str(report_id) if report_id else "temp",
+        "status": "final",
+        "type": {
+            "coding": [{
+                "system": "http://loinc.org",
+                "code": "11502-2",
+                "display": "Laboratory report"
+            }]
+        },
+        "subject": {"reference": "Patient/123"},
+        "date": "2024-05-21",
+        "title": "AyurAI Diagnostic Report",
+        "section": [
+            {
+                "title": "Ayurvedic Constitution",
+                "code": {"text": "Prakriti/Vikriti"},
+                "text": {
+                    "status": "generated",
+                    "div": f"<div xmlns='http://www.w3.org/1999/xhtml'>Primary Imbalance: <b>{diagnosis}</b></div>"
+                }
+            },
+            {
+                "title": "Clinical Reasoning",
+                "text": {
+                    "status": "generated",
+                    "div": f"<div xmlns='http://www.w3.org/1999/xhtml'>{fields['explanation']}</div>"
+                }
+            }
+        ]
+    }
+
+    return {
+        "id": report_id,
+        "diagnosis": diagnosis,
+        "details": evidence,
+        "contradictions": contradictions,
+        "scores": scores,
+        "fhir_report": fhir_report,
+        **fields
+    }
+
+def build_report(diagnosis, symptoms, scores, evidence, contradictions, llm_result):
+    """
+    Merges the LLM report (or rule-based defaults when it is None), saves it and
+    returns the /api/diagnose response.
+    """
+    fields = merge_llm_result(diagnosis, evidence, llm_result)
+    report_id = save_report(diagnosis, symptoms, scores, contradictions, stored_explanation(fields),
+                            fields["recommendations"])
+    return report_response(report_id, diagnosis, scores, evidence, contradictions, fields)
+
+async def enrich_report(payload):
+    """
+    Background phase of /api/diagnose/jobs: LLM report, then update the stored report.
+    """
+    diagnosis, symptoms, scores, evidence, contradictions = (
+        payload[k] for k in ("diagnosis", "symptoms", "scores", "evidence", "contradictions"))
+    llm_result = await llm.generate_report(diagnosis, symptoms, scores, contradictions,
+                                           priority=PRIORITY_BACKGROUND)
+    fields = merge_llm_result(diagnosis, evidence, llm_result)
+    if llm_result and payload["report_id"]:
+        await run_in_threadpool(update_report, payload["report_id"], stored_explanation(fields),
+                                fields["recommendations"])
+    return report_response(payload["report_id"], diagnosis, scores, evidence, contradictions, fields)
+
+# LLM enrichment runs here, off the request path (bounded; see report_jobs.py)
+enrichment_jobs = JobQueue(enrich_report)
+
 # --- Routes ---
 
 @router.get("/history")
 async def read_history(current_user: dict = Depends(get_current_user)):
     return get_history()
 
+def _resume_session(data, current_user):
+    session = chat_sessions.resume(data.session_id, data.context, data.history, owner=current_user["id"])
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
 @router.post("/chat")
 async def chat_with_vaidya(data: ChatRequest, current_user: dict = Depends(get_current_user)):
     """
     Chat with the Ayurvedic AI using the context of a specific report.
     """
-    response = llm.chat_with_context(data.history, data.message, data.context)
-    return {"response": response}
+    session = _resume_session(data, current_user)
+    async with session.lock:
+        if not llm.is_available():
+            response, stats = "I apologize, but I am currently unable to access my medical knowledge base. Please try again later.", None
+        else:
+            response, stats = await llm.session_chat(session, data.message)
+    return {
+        "response": response or "I am having trouble connecting to my thought process right now.",
+        "session_id": session.id,
+        "generation": stats.as_dict() if stats else None
+    }
+
+@router.post("/chat/stream")
+async def chat_with_vaidya_stream(data: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events: `token` events as the answer is generated, then `done` with the
+    full response, the session_id for the next turn and time-to-first-token /
+    tokens-per-second. Generation stops if the client disconnects (the turn is not kept).
+    """
+    session = _resume_session(data, current_user)
+
+    async def events():
+        stats = GenerationStats()
+        chunks = []
+        async with session.lock:
+            try:
+                async for token in llm.stream_session_chat(session, data.message, stats):
+                    chunks.append(token)
+                    yield sse("token", {"token": token})
+            except asyncio.CancelledError:
+                logger.info(f"Chat stream cancelled by client after {stats.tokens} tokens")
+                raise
+            except Exception as e:
+                logger.error(f"Chat stream failed: {e}")
+                yield sse("error", {"message": "I am having trouble connecting to my thought process right now.",
+                                    "session_id": session.id})
+                return
+        yield sse("done", {"response": "".join(chunks), "session_id": session.id, "generation": stats.as_dict()})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.post("/diagnose")
 async def diagnose(data: DiagnosticRequest, current_user: dict = Depends(get_current_user)):
-    try:
-        symptoms = []
-        
-        # 1. Pulse Analysis
-        if data.pulse:
-            bpm = data.pulse.get("bpm")
-            if bpm:
-                if bpm > 90: symptoms.append("High Heart Rate (Pitta/Vata)")
-                elif bpm < 60: symptoms.append("Low Heart Rate (Kapha)")
-                
-        # 2. Tongue Analysis
-        if data.tongue and data.tongue.get("diagnosis"):
-            symptoms.extend(data.tongue["diagnosis"])
-
-        # 3. Questionnaire
-        if data.questionnaire:
-            q = data.questionnaire
-            if q.get("sleep") == "disturbed": symptoms.append("Disturbed Sleep (Vata)")
-            if q.get("digestion") == "acidic": symptoms.append("Acidic Digestion (Pitta)")
-            if q.get("digestion") == "bloating": symptoms.append("Bloating (Vata)")
-            if q.get("digestion") == "slow": symptoms.append("Slow Digestion (Kapha)")
-            
-            if q.get("energy") == "high": symptoms.append("High Energy")
-            if q.get("energy") == "low": symptoms.append("Low Energy")
-            if q.get("energy") == "variable": symptoms.append("Variable Energy")
-                 
-        # Inference (Rule-Based + Contradictions)
-        diagnosis, scores, evidence, contradictions = expert.infer_dosha(symptoms)
-            
-        # Generative AI Report (Ollama)
-        llm_result = llm.generate_report(diagnosis, symptoms, scores, contradictions)
-        
-        # Default values
-        explanation = f"Primary imbalance detected as {diagnosis}. " + " | ".join(evidence)
-        recommendations = get_recommendations(diagnosis)
-        depth = "Rule-Based (Standard)"
-        reasoning = "Diagnosis based on algorithmic rule matching of pulse rate and reported symptoms."
-        reference = "General Ayurvedic Principles"
-        confidence = 75 # Default rule-based confidence
-        
+    symptoms = collect_symptoms(data)
+
+    # Inference (Rule-Based + Contradictions)
+    diagnosis, scores, evidence, contradictions = expert.infer_dosha(symptoms)
+
+    # Generative AI Report (Ollama)
+    llm_result = await llm.generate_report(diagnosis, symptoms, scores, contradictions)
+
+    return build_report(diagnosis, symptoms, scores, evidence, contradictions, llm_result)
+
+@router.post("/diagnose/stream")
+async def diagnose_stream(data: DiagnosticRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events: `diagnosis` (rule-based result, immediately), `token` (LLM report
+    text as it is generated), then `done` with the saved report and generation stats.
+    """
+    symptoms = collect_symptoms(data)
+    diagnosis, scores, evidence, contradictions = expert.infer_dosha(symptoms)
+
+    async def events():
+        yield sse("diagnosis", {"diagnosis": diagnosis, "details": evidence,
+                                "contradictions": contradictions, "scores": scores})
+        inputs = canonical_report_inputs(diagnosis, symptoms, scores, contradictions)
+        key = llm.report_key(inputs)
+        cached = await llm.cached_report(key)
+        if cached is not None:
+            report = await run_in_threadpool(build_report, diagnosis, symptoms, scores, evidence, contradictions, cached)
+            yield sse("done", {"report": report, "generation": {"cached": True}})
+            return
+
+        stats = GenerationStats()
+        chunks = []
+        try:
+            async for token in llm.stream_report(inputs, stats):
+                chunks.append(token)
+                yield sse("token", {"token": token})
+        except asyncio.CancelledError:
+            logger.info(f"Report stream cancelled by client after {stats.tokens} tokens")
+            raise
+        except Exception as e:
+            logger.error(f"Report stream failed: {e}")
+            chunks = []  # fall back to the rule-based report
+        llm_result = parse_report("".join(chunks))
         if llm_result:
-            explanation = llm_result.get("explanation", explanation)
-            recommendations = llm_result.get("recommendations", recommendations)
-            depth = "Generative AI (Deep Analysis)"
-            reasoning = llm_result.get("reasoning", reasoning)
-            reference = llm_result.get("reference", reference)
-            confidence = llm_result.get("confidence_score", 85)
-            
-        # Save to DB (Modified to include new fields in explanation for now, or just save standard)
-        # For this iteration, we might not change DB schema yet, but we return to frontend.
-        # We append reasoning to explanation for storage if DB is strict, or just pass it through.
-        full_explanation = f"{explanation}\n\nReasoning: {reasoning}\nReference: {reference}"
-        report_id = save_report(diagnosis, symptoms, scores, contradictions, full_explanation, recommendations)
-            
-        # Mock FHIR Report
-        fhir_report = {
-            "resourceType": "Composition",
-            "id": str(report_id) if report_id else "temp",
-            "status": "final",
-            "type": {
-                "coding": [{
-                    "system": "http://loinc.org",
-                    "code": "11502-2",
-                    "display": "Laboratory report"
-                }]
-            },
-            "subject": {"reference": "Patient/123"},
-            "date": "2024-05-21",
-            "title": "AyurAI Diagnostic Report",
-            "section": [
-                {
-                    "title": "Ayurvedic Constitution",
-                    "code": {"text": "Prakriti/Vikriti"},
-                    "text": {
-                        "status": "generated",
-                        "div": f"<div xmlns='http://www.w3.org/1999/xhtml'>Primary Imbalance: <b>{diagnosis}</b></div>"
-                    }
-                },
-                {
-                    "title": "Clinical Reasoning",
-                    "text": {
-                        "status": "generated",
-                        "div": f"<div xmlns='http://www.w3.org/1999/xhtml'>{explanation}</div>"
-                    }
-                }
-            ]
-        }
-
-        return {
-            "id": report_id,
-            "diagnosis": diagnosis,
-            "details": evidence,
-            "contradictions": contradictions,
-            "scores": scores,
-            "fhir_report": fhir_report,
-            "recommendations": recommendations,
-            "recommendations": recommendations,
-            "analysis_depth": depth,
-            "reasoning": reasoning,
-            "reference": reference,
-            "confidence_score": confidence
-        }
-    except Exception as e:
-        # We assume main.py handles global exceptions, but we can re-raise
-        raise e
+            await llm.store_report(key, llm_result)
+        report = await run_in_threadpool(build_report, diagnosis, symptoms, scores, evidence, contradictions, llm_result)
+        yield sse("done", {"report": report, "generation": stats.as_dict()})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/diagnose/jobs")
+async def diagnose_job(data: DiagnosticRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Two-phase diagnosis: the rule-based report is saved and returned at once, with a job id.
+    The LLM enrichment runs in the background and updates the stored report; follow it with
+    GET /api/diagnose/jobs/{job_id} (poll) or /api/diagnose/jobs/{job_id}/events (SSE).
+    """
+    symptoms = collect_symptoms(data)
+    diagnosis, scores, evidence, contradictions = expert.infer_dosha(symptoms)
+    report = await run_in_threadpool(build_report, diagnosis, symptoms, scores, evidence, contradictions, None)
+    job = enrichment_jobs.submit({
+        "report_id": report["id"], "diagnosis": diagnosis, "symptoms": symptoms,
+        "scores": scores, "evidence": evidence, "contradictions": contradictions
+    }, owner=current_user["id"])
+    return {**report, "job_id": job.id, "job_status": job.status}
+
+def _get_job(job_id, current_user):
+    job = enrichment_jobs.get(job_id)
+    # Another user's job is reported as missing, not forbidden
+    if not job or job.owner != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/diagnose/jobs/{job_id}")
+async def diagnose_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
+    return _get_job(job_id, current_user).as_dict()
+
+@router.get("/diagnose/jobs/{job_id}/events")
+async def diagnose_job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events: `status` now, then `done` once the enrichment finishes
+    (keep-alive comments every 15 s meanwhile).
+    """
+    job = _get_job(job_id, current_user)
+
+    async def events():
+        yield sse("status", {"job_id": job.id, "status": job.status})
+        while not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+        yield sse("done", job.as_dict())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.post("/feedback")
 async def submit_feedback(data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
@@ -185,7 +368,6 @@ async def get_report_pdf(report_id: int, current_user: dict = Depends(get_curren
         raise HTTPException(status_code=404, detail="Report not found")
         
     from pdf_generator import generate_pdf_report
-    from fastapi.responses import StreamingResponse
     
     pdf_buffer = generate_pdf_report(report)
     
@@ -1,5 +1,9 @@
 from fastapi import APIRouter
-import psutil
+from model_registry import registry
+from llm_engine import llm, report_cache
+from routers.diagnostics import enrichment_jobs
+from chat_sessions import chat_sessions
+import sys
 import time
 import os
 
@@ -8,13 +12,35 @@ start_time = time.time()
 
 @router.get("/health")
 async def system_health():
+    import psutil
     process = psutil.Process(os.getpid())
+    # Only report rPPG stats if the module has been loaded; health checks must not pull in cv2
+    rppg_sessions = getattr(sys.modules.get("rppg"), "sessions", None)
+    vision_cache = getattr(sys.modules.get("vision"), "result_cache", None)
+    models = registry.status()
+    vision_pool = registry.get("vision_pool") if models.get("vision_pool", {}).get("state") == "ready" else None
+    embeddings = registry.get("embedding_indexer") if models.get("embedding_indexer", {}).get("state") == "ready" else None
+    analyzer = registry.get("tongue_analyzer") if models.get("tongue_analyzer", {}).get("state") == "ready" else None
+    # Cascade escalation metrics (only the in-process analyzer; pool workers keep their own)
+    vision_model = getattr(getattr(analyzer, "model", None), "stats", None)
     return {
         "status": "online",
+        "llm": llm.stats(),
+        "report_cache": report_cache.stats(),
+        "enrichment_jobs": enrichment_jobs.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "models_ready": registry.ready(),
+        "models": models,
+        "import_profile_seconds": registry.import_profile,
         "uptime_seconds": round(time.time() - start_time, 2),
         "cpu_percent": psutil.cpu_percent(),
         "memory_info": {
             "rss": process.memory_info().rss / 1024 / 1024, # MB
             "percent": process.memory_percent()
-        }
+        },
+        "rppg": rppg_sessions.stats() if rppg_sessions else None,
+        "vision_cache": vision_cache.stats() if vision_cache else None,
+        "vision_pool": vision_pool.stats() if vision_pool else None,
+        "embeddings": embeddings.stats() if embeddings else None,
+        "vision_model": vision_model() if vision_model else None
     }
@@ -1,13 +1,161 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+import asyncio
+import json
+import os
+import zipfile
+from typing import List
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
 from fastapi.concurrency import run_in_threadpool
-from vision import analyzer
+from fastapi.responses import StreamingResponse
 from dependencies import validate_image_file
+from vision_pool import VISION_WORKERS
+from embedding_index import EMBEDDINGS_ENABLED
 
 router = APIRouter(prefix="/api/vision", tags=["Vision"])
 
+# Batch uploads: images analysed concurrently (threadpool callers share YOLO micro-batches)
+BATCH_CONCURRENCY = int(os.getenv("AYURAI_VISION_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_IMAGES = int(os.getenv("AYURAI_VISION_BATCH_MAX_IMAGES", "500"))
+BATCH_MAX_IMAGE_BYTES = 20 * 1024 * 1024  # per image, uncompressed (zip members)
+
+BATCH_IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp")
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+async def _analyze(contents):
+    # Imported on first use so workers that never see vision traffic skip cv2/YOLO
+    if VISION_WORKERS:
+        # Analysis runs in the vision worker processes (AYURAI_VISION_WORKERS)
+        from vision_pool import get_pool
+        pool = await run_in_threadpool(get_pool)
+        result = await pool.analyze_cached(contents)
+    else:
+        from vision import get_analyzer
+        # Offload heavy CV analysis (and the first-use model load) to threadpool
+        analyzer = await run_in_threadpool(get_analyzer)
+        # Identical uploads (retries, double-clicks) are served from the result cache
+        result = await run_in_threadpool(analyzer.analyze_cached, contents)
+    if result and EMBEDDINGS_ENABLED:
+        # Queued for the similar-case index; embedding happens off the request path
+        from embedding_index import get_indexer
+        indexer = await run_in_threadpool(get_indexer)
+        indexer.submit(contents, result["diagnosis"][0], result["confidence"])
+    return result
+
 @router.post("/tongue")
 async def analyze_tongue(file: UploadFile = Depends(validate_image_file)):
     contents = await file.read()
-    # Offload heavy CV analysis to threadpool
-    result = await run_in_threadpool(analyzer.analyze_image, contents)
+    return await _analyze(contents)
+
+def _is_zip(upload):
+    return upload.content_type in ZIP_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+def _zip_members(upload):
+    archive = zipfile.ZipFile(upload.file)
+    return archive, [info for info in archive.infolist()
+                     if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+async def _iter_images(files):
+    """
+    Yields (filename, bytes | None, error) one image at a time; uploads are spooled to
+    disk by the multipart parser and zip members are inflated only when reached.
+    """
+    count = 0
+    for upload in files:
+        if _is_zip(upload):
+            try:
+                archive, members = await run_in_threadpool(_zip_members, upload)
+            except zipfile.BadZipFile:
+                yield upload.filename, None, "Invalid zip archive"
+                continue
+            with archive:
+                for info in members:
+                    count += 1
+                    if count > BATCH_MAX_IMAGES:
+                        yield upload.filename, None, f"Batch limit of {BATCH_MAX_IMAGES} images reached"
+                        return
+                    name = f"{upload.filename}/{info.filename}"
+                    if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                        yield name, None, "Image too large"
+                        continue
+                    yield name, await run_in_threadpool(archive.read, info), None
+        else:
+            count += 1
+            if count > BATCH_MAX_IMAGES:
+                yield upload.filename, None, f"Batch limit of {BATCH_MAX_IMAGES} images reached"
+                return
+            if upload.content_type not in BATCH_IMAGE_TYPES:
+                yield upload.filename, None, "Invalid file type"
+                continue
+            yield upload.filename, await upload.read(), None
+
+async def _analyze_item(index, filename, contents, error):
+    line = {"index": index, "filename": filename}
+    if error is None:
+        try:
+            result = await _analyze(contents)
+            if result is None:
+                error = "Could not decode image"
+            else:
+                line.update(result)
+        except Exception as e:
+            error = str(e)
+    if error is not None:
+        line["error"] = error
+    return line
+
+async def _stream_batch(files):
+    """
+    Bounded pipeline: at most BATCH_CONCURRENCY images in flight, one NDJSON line per
+    image in completion order (each line carries its upload index), then a summary line.
+    """
+    pending = set()
+    total = errors = 0
+
+    def emit(done):
+        nonlocal errors
+        for task in done:
+            line = task.result()
+            errors += "error" in line
+            yield json.dumps(line) + "\n"
+
+    try:
+        async for filename, contents, error in _iter_images(files):
+            if len(pending) >= BATCH_CONCURRENCY:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for line in emit(done):
+                    yield line
+            pending.add(asyncio.create_task(_analyze_item(total, filename, contents, error)))
+            total += 1
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for line in emit(done):
+                yield line
+    finally:
+        # Client went away mid-stream: don't leave analyses running for nobody
+        for task in pending:
+            task.cancel()
+    yield json.dumps({"done": True, "images": total, "errors": errors}) + "\n"
+
+@router.post("/tongue/batch")
+async def analyze_tongue_batch(files: List[UploadFile] = File(...)):
+    """
+    Many tongue photos (and/or zip archives of them) in one request.
+    Streams application/x-ndjson: one result per image as it finishes.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    return StreamingResponse(_stream_batch(files), media_type="application/x-ndjson")
+
+@router.post("/similar")
+async def similar_tongues(file: UploadFile = Depends(validate_image_file), k: int = Query(10, ge=1, le=100)):
+    """
+    Most similar previously analysed tongue images (cosine similarity of ResNet50 embeddings).
+    """
+    if not EMBEDDINGS_ENABLED:
+        raise HTTPException(status_code=503, detail="Similar-case search is disabled (AYURAI_EMBEDDINGS=1)")
+    from embedding_index import similar_cases
+    contents = await file.read()
+    result = await run_in_threadpool(similar_cases, contents, k)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
     return result
@@ -1,26 +1,126 @@
-from fastapi import APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
 import logging
-from rppg import processor
+import os
+import shutil
+import struct
+import tempfile
+import time
 from dependencies import validate_video_file
 
 router = APIRouter(prefix="/api", tags=["Vitals"])
 logger = logging.getLogger("AyurAI.Vitals")
 
+class LatestFrameSlot:
+    """
+    Per-connection hand-off between the websocket receiver and the processing worker.
+    Image frames are latest-wins: a frame still pending when a newer one arrives is
+    dropped, so the worker always processes the newest frame and latency stays bounded.
+    Pre-averaged sample packets are tiny and carry history the resampler needs, so
+    they are queued (up to max_samples packets) rather than replaced.
+    Legacy frames without a capture timestamp are stamped with their arrival time:
+    unstamped, each counts as one fixed 1/fps step, and dropping some would speed up
+    the pulse.
+    """
+    def __init__(self, max_samples=64):
+        from rppg import PACKET_SAMPLES, PACKET_TIMED_FRAME
+        self.samples_type = bytes([PACKET_SAMPLES])
+        self.timed_type = bytes([PACKET_TIMED_FRAME])
+        self.max_samples = max_samples
+        self.pending = []
+        self.frame_index = None  # position of the pending image frame in self.pending
+        self.dropped = 0
+        self._event = asyncio.Event()
+
+    def put(self, data):
+        if data[:1] == self.samples_type:
+            if len(self.pending) >= self.max_samples:
+                self._drop(0)
+            self.pending.append(data)
+        else:
+            if data[:1] != self.timed_type:
+                data = self.timed_type + struct.pack("<d", time.monotonic() * 1000) + data
+            if self.frame_index is not None:
+                self._drop(self.frame_index)
+            self.frame_index = len(self.pending)
+            self.pending.append(data)
+        self._event.set()
+
+    def _drop(self, index):
+        del self.pending[index]
+        self.dropped += 1
+        if self.frame_index is not None:
+            if index == self.frame_index:
+                self.frame_index = None
+            elif index < self.frame_index:
+                self.frame_index -= 1
+
+    async def take(self):
+        await self._event.wait()
+        self._event.clear()
+        batch, self.pending, self.frame_index = self.pending, [], None
+        return batch
+
+def _process_batch(processor, batch):
+    result = None
+    for data in batch:
+        result = processor.process_packet(data) or result
+    return result
+
+async def _rppg_worker(websocket, slot, session_id, mode, changes_only):
+    from rppg import sessions, engine
+    last_sent = None
+    reported_drops = 0
+    while True:
+        batch = await slot.take()
+        processor = sessions.get(session_id, mode=mode)
+        if processor.mode == "batched":
+            # BPM comes from the shared engine tick; sample packets are just ring writes
+            engine.ensure_started()
+        if processor.mode == "batched" and all(data[:1] == slot.samples_type for data in batch):
+            result = _process_batch(processor, batch)
+        else:
+            # Run CPU-bound signal processing in a separate thread
+            result = await run_in_threadpool(_process_batch, processor, batch)
+        sessions.record_frames(processed=len(batch), dropped=slot.dropped - reported_drops)
+        reported_drops = slot.dropped
+
+        if not result:
+            result = {"bpm": None, "signal": 0, "snr": 0}
+        if changes_only and (result["bpm"], result["snr"]) == last_sent:
+            continue
+        last_sent = (result["bpm"], result["snr"])
+        result["dropped"] = slot.dropped
+        await websocket.send_json(result)
+
 @router.websocket("/ws/rppg")
 async def rppg_stream(websocket: WebSocket):
+    # rppg (cv2/SciPy) is imported on first use, keeping it out of API startup
+    from rppg import sessions, RPPG_MODES
+    # ?mode=reference selects the full-recompute estimator (accuracy comparison), ?mode=batched the shared engine
+    mode = websocket.query_params.get("mode")
+    if mode is not None and mode not in RPPG_MODES:
+        # Rejected before the handshake: 1008 = policy violation
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
+    # Each connection gets its own signal buffer
+    session_id = sessions.new_session_id()
+    # ?changes_only=1 only sends a reply when the BPM/SNR reading changes
+    changes_only = websocket.query_params.get("changes_only") in ("1", "true")
+
+    # Receiver keeps reading while the worker processes; a slow worker drops stale frames
+    slot = LatestFrameSlot()
+    worker = asyncio.create_task(_rppg_worker(websocket, slot, session_id, mode, changes_only))
     try:
-        while True:
+        while not worker.done():
             data = await websocket.receive_bytes()
-            # Run CPU-bound signal processing in a separate thread
-            result = await run_in_threadpool(processor.process_frame, data)
-            
-            if result:
-                await websocket.send_json(result)
-            else:
-                await websocket.send_json({"bpm": None, "signal": 0, "snr": 0})
-                
+            slot.put(data)
+        # Worker exited on its own (send failure) - surface its error
+        worker.result()
+
     except WebSocketDisconnect:
         logger.info("rPPG Client disconnected")
     except Exception as e:
@@ -29,9 +129,55 @@ async def rppg_stream(websocket: WebSocket):
             await websocket.close()
         except:
             pass
+    finally:
+        worker.cancel()
+        sessions.release(session_id)
+
+def _analyze_upload(file):
+    from rppg import analyze_video
+    # Spool the clip to disk in chunks so OpenCV can decode it frame by frame without holding it in RAM
+    suffix = os.path.splitext(file.filename or "")[1] or (".mp4" if file.content_type == "video/mp4" else ".webm")
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp, 1024 * 1024)
+        path = tmp.name
+    try:
+        return analyze_video(path)
+    finally:
+        os.remove(path)
+
+async def _analyze_video_upload(file):
+    file = await validate_video_file(file)
+    result = await run_in_threadpool(_analyze_upload, file)
+    if result is None:
+        # OpenCV could not open the clip or decode a single frame
+        raise HTTPException(status_code=422, detail="Could not decode any frames from the video.")
+    return result
+
+@router.post("/rppg/video")
+async def process_rppg_video(file: UploadFile = File(...)):
+    """
+    Whole-clip rPPG for recorded webm/mp4 uploads: BPM, SNR and a per-window BPM timeline.
+    """
+    return await _analyze_video_upload(file)
 
 @router.post("/rppg")
-async def process_rppg(file: UploadFile = File(...)): # Removed strict validation here for raw blobs/testing
+async def process_rppg(file: UploadFile = File(...), session_id: Optional[str] = Form(None),
+                       timestamp: Optional[float] = Form(None)): # Removed strict validation here for raw blobs/testing
+    # Recorded clips go through the batch path instead of single-frame decode
+    if file.content_type and file.content_type.startswith("video/"):
+        return await _analyze_video_upload(file)
+
+    from rppg import sessions, engine
+    # Frames posted with the same session_id share a buffer; a new id is issued otherwise
+    session_id = session_id or sessions.new_session_id()
     contents = await file.read()
-    result = await run_in_threadpool(processor.process_frame, contents)
-    return result if result else {"bpm": None, "signal": 0}
+    processor = sessions.get(session_id)
+    if processor.mode == "batched":
+        # BPM comes from the shared engine tick, as for websocket sessions
+        engine.ensure_started()
+    # timestamp: client capture time in ms, used to resample uneven frame rates
+    result = await run_in_threadpool(processor.process_frame, contents, timestamp)
+    response = result if result else {"bpm": None, "signal": 0}
+    response["session_id"] = session_id
+    return response
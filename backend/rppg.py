@@ -1,92 +1,675 @@
 import cv2
 import numpy as np
 from scipy import signal
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import threading
+import logging
+import os
+import struct
+import time
+import uuid
+from image_utils import decode_reduced
+
+logger = logging.getLogger("AyurAI.rPPG")
+
+# Pulse band: 0.7Hz to 4Hz -> 42 to 240 BPM
+PULSE_BAND = (0.7, 4.0)
+
+# Websocket packet types. Anything else is treated as a bare image frame (legacy clients).
+#   0x01 | float64 capture timestamp (ms, little-endian) | JPEG/PNG bytes
+#   0x02 | N x (float64 timestamp ms, float32 mean R, G, B)  - client-side ROI averaging
+PACKET_TIMED_FRAME = 0x01
+PACKET_SAMPLES = 0x02
+_TIMESTAMP = struct.Struct("<d")
+SAMPLE_DTYPE = np.dtype([("t", "<f8"), ("r", "<f4"), ("g", "<f4"), ("b", "<f4")])
+
+# Face ROI: (2*ROI_HALF_SIZE)^2 pixels at full resolution
+ROI_HALF_SIZE = 100
+# Reduced JPEG decode keeps the frame's shorter side >= this many pixels...
+DECODE_MIN_SIDE = 120
+# ...and the ROI >= 2*(ROI_HALF_SIZE//8) = 24px wide. At 1/8 scale every pixel is an 8x8 block
+# average, so the ROI mean stays within ~0.5 intensity levels of a full decode; the difference is
+# a near-constant offset that the bandpass removes.
+DECODE_MAX_FACTOR = 8
+
+# A capture gap longer than this restarts the signal instead of interpolating across it
+MAX_SAMPLE_GAP = 1.0
+
+# Estimator used for new sessions: "streaming", "reference" or "batched" (shared RPPGEngine)
+RPPG_MODE = os.getenv("AYURAI_RPPG_MODE", "streaming")
+RPPG_MODES = ("streaming", "reference", "batched")
+
+@lru_cache(maxsize=32)
+def design_bandpass(fps, output='ba'):
+    """
+    Butterworth bandpass coefficients for the pulse band, designed once per fps.
+    Returns None when fps is too low to represent the band.
+    """
+    try:
+        return signal.butter(2, list(PULSE_BAND), btype='bandpass', fs=fps, output=output)
+    except ValueError:
+        return None
+
+def estimate_bpm(filtered, fps):
+    """
+    BPM and SNR from a bandpassed pulse signal: peak spacing first, FFT as fallback.
+    """
+    # Time Domain Peak Detection
+    peaks, properties = signal.find_peaks(filtered, distance=fps/2.5, prominence=0.1) # Min dist ~0.4s (150 BPM limit) for stability
+
+    bpm = 0
+    snr = 0
+
+    if len(peaks) > 2:
+        # Calculate BPM from peak intervals
+        intervals = np.diff(peaks)
+        avg_interval = np.mean(intervals)
+        bpm = (60 * fps) / avg_interval
+
+        # Simple SNR: Peak height vs background noise
+        signal_power = np.mean(filtered[peaks]**2)
+        noise_power = np.mean(filtered**2) - signal_power
+        if noise_power > 0:
+            snr = 10 * np.log10(signal_power / noise_power)
+
+    # Fallback to FFT if time domain fails or is erratic
+    if bpm == 0 or bpm > 200 or bpm < 40:
+         # FFT
+        fft = np.fft.rfft(filtered)
+        freqs = np.fft.rfftfreq(len(filtered), 1.0/fps)
+        msg_idx = np.argmax(np.abs(fft))
+        bpm = freqs[msg_idx] * 60
+
+    return int(bpm), round(float(snr), 2)
+
+def spectral_bpm(windows, fps, pad_factor=8):
+    """
+    Vectorized spectral BPM over a 2-D array of bandpassed windows (one window per row).
+    Returns (bpm, snr_db) arrays. SNR is the power around the spectral peak
+    against the rest of the pulse band.
+    """
+    windows = np.atleast_2d(windows)
+    n_fft = 1 << int(np.ceil(np.log2(windows.shape[1] * pad_factor)))
+    power = np.abs(np.fft.rfft(windows, n=n_fft, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(n_fft, 1.0/fps)
+
+    band = (freqs >= PULSE_BAND[0]) & (freqs <= PULSE_BAND[1])
+    band_freqs = freqs[band]
+    band_power = power[:, band]
+    peak_idx = np.argmax(band_power, axis=1)
+    peak_freqs = band_freqs[peak_idx]
+
+    # Peak neighbourhood: +/- 0.1 Hz around the dominant frequency
+    near_peak = np.abs(band_freqs[None, :] - peak_freqs[:, None]) <= 0.1
+    signal_power = np.sum(band_power * near_peak, axis=1)
+    noise_power = np.sum(band_power * ~near_peak, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snr = 10 * np.log10(signal_power / noise_power)
+    snr = np.where(np.isfinite(snr), snr, 0.0)
+
+    return peak_freqs * 60, snr
+
+def center_roi(img, rect_size=ROI_HALF_SIZE):
+    """
+    Simplified face detection: a (2*rect_size)^2 center crop, clamped to the frame.
+    """
+    h, w = img.shape[:2]
+    center_h, center_w = h // 2, w // 2
+    half = min(rect_size, center_h, center_w)
+    return img[center_h-half:center_h+half, center_w-half:center_w+half]
 
 class RPPGProcessor:
-    def __init__(self, buffer_size=150):
+    """
+    Pulse estimation from the green channel of a face ROI.
+
+    mode="streaming" filters causally sample by sample (SOS state carried across
+    frames, running detrend) and re-estimates BPM every `bpm_interval` frames.
+    mode="reference" recomputes detrend + zero-phase filtfilt over the whole
+    buffer on every frame; it is kept for accuracy comparison.
+
+    mode="batched" stores the signal as a row of a shared RPPGEngine, which
+    estimates BPM for all due sessions in one vectorized tick.
+
+    Samples that carry a capture timestamp are linearly resampled onto a uniform
+    grid at `fps`, so uneven browser frame rates do not skew the BPM.
+    """
+    def __init__(self, buffer_size=150, mode="streaming", bpm_interval=15, fps=30, engine=None):
+        if mode not in RPPG_MODES:
+            raise ValueError(f"Unknown rPPG mode: {mode}")
         self.buffer_size = buffer_size
-        self.red_channel_buffer = []
-        self.fps = 30  # Assumed FPS
-        
-    def process_frame(self, frame_bytes):
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(frame_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+        self.bpm_interval = max(1, int(bpm_interval))
+        # Preallocated ring buffers (float32) - avoid O(n) list shifts per frame
+        self.green_buffer = np.zeros(buffer_size, dtype=np.float32)
+        self.filtered_buffer = np.zeros(buffer_size, dtype=np.float32)
+        self.engine = None
+        self.engine_row = None
+        if mode == "batched":
+            row = engine.allocate() if engine is not None else None
+            if row is None:
+                logger.warning("rPPG engine full, falling back to streaming mode")
+                mode = "streaming"
+            else:
+                # The signal lives directly in the engine's 2-D array
+                self.engine, self.engine_row = engine, row
+                self.green_buffer = engine.signals[row]
+        self.mode = mode
+        self.write_index = 0
+        self.count = 0
+        self.running_sum = 0.0
+        self.fps = fps  # Uniform grid rate the estimator works at
+        self.reset_resampler()
+        self.reset_filter()
+
+    def reset_resampler(self):
+        self.last_time = None
+        self.last_value = None
+        self.next_grid_time = None
+        self.measured_fps = None
+
+    def reset_filter(self):
+        sos = design_bandpass(self.fps, output='sos')
+        self.sos = sos.tolist() if sos is not None else None
+        self.filter_state = None
+        self.baseline = None
+        # Running detrend: EMA baseline with a ~1.5s time constant
+        self.baseline_alpha = 1.0 / (1.5 * self.fps)
+        self.filtered_count = 0
+        self.frames_since_estimate = 0
+        self.last_estimate = (None, 0)
+
+    @property
+    def nbytes(self):
+        return self.green_buffer.nbytes + self.filtered_buffer.nbytes
+
+    def reset(self):
+        self.green_buffer.fill(0)
+        self.filtered_buffer.fill(0)
+        self.write_index = 0
+        self.count = 0
+        self.running_sum = 0.0
+        self.reset_resampler()
+        self.reset_filter()
+        # close() may clear engine_row from another thread: read it once
+        row = self.engine_row
+        if row is not None:
+            self.engine.advance(row, self.write_index, self.count)
+
+    def close(self):
+        """
+        Returns the engine row (batched mode). Later writes go to a private copy.
+        """
+        if self.engine_row is not None:
+            row, self.engine_row = self.engine_row, None
+            self.green_buffer = self.green_buffer.copy()
+            self.engine.release(row)
+
+    def push_sample(self, value):
+        # Overwrite the oldest sample once the ring is full
+        if self.count == self.buffer_size:
+            self.running_sum -= float(self.green_buffer[self.write_index])
+        else:
+            self.count += 1
+        self.green_buffer[self.write_index] = value
+        self.running_sum += float(value)
+        if self.mode == "streaming":
+            self.filtered_buffer[self.write_index] = self._filter_sample(value)
+        self.write_index = (self.write_index + 1) % self.buffer_size
+        row = self.engine_row
+        if row is not None:
+            self.engine.advance(row, self.write_index, self.count, new_samples=1)
+
+    def _filter_sample(self, value):
+        if self.sos is None:
+            return 0.0
+        value = float(value)
+        if self.baseline is None:
+            self.baseline = value
+            self.filter_state = [[0.0, 0.0] for _ in self.sos]
+        self.baseline += self.baseline_alpha * (value - self.baseline)
+        # One sample through the biquad cascade (transposed direct form II, same as sosfilt).
+        # Plain floats: a scipy call per sample would cost more than the filtering itself.
+        x = value - self.baseline
+        for (b0, b1, b2, _, a1, a2), z in zip(self.sos, self.filter_state):
+            y = b0 * x + z[0]
+            z[0] = b1 * x - a1 * y + z[1]
+            z[1] = b2 * x - a2 * y
+            x = y
+        self.filtered_count += 1
+        self.frames_since_estimate += 1
+        return x
+
+    def add_measurement(self, value, timestamp=None):
+        """
+        Adds one ROI mean. Without a timestamp the sample is taken as one grid step
+        (the legacy fixed-fps assumption); with one (seconds) it is resampled.
+        """
+        if timestamp is None:
+            self.push_sample(value)
+            return
+
+        value = float(value)
+        if self.last_time is not None:
+            dt = timestamp - self.last_time
+            if dt <= 0:
+                return  # duplicate or out-of-order sample
+            if dt > MAX_SAMPLE_GAP:
+                self.reset()
+            else:
+                rate = 1.0 / dt
+                self.measured_fps = rate if self.measured_fps is None else 0.9 * self.measured_fps + 0.1 * rate
+                # Emit every grid point up to this sample by linear interpolation
+                step = 1.0 / self.fps
+                while self.next_grid_time <= timestamp:
+                    frac = (self.next_grid_time - self.last_time) / dt
+                    self.push_sample(self.last_value + frac * (value - self.last_value))
+                    self.next_grid_time += step
+                self.last_time, self.last_value = timestamp, value
+                return
+
+        # First sample (or restart after a gap)
+        self.push_sample(value)
+        self.last_time, self.last_value = timestamp, value
+        self.next_grid_time = timestamp + 1.0 / self.fps
+
+    def ordered_buffer(self, buffer=None):
+        """
+        Returns the buffered samples oldest-first.
+        """
+        buffer = self.green_buffer if buffer is None else buffer
+        if self.count < self.buffer_size:
+            return buffer[:self.count]
+        return np.roll(buffer, -self.write_index)
+
+    def process_packet(self, data):
+        """
+        Websocket entry point: dispatches on the packet type byte (see PACKET_*).
+        """
+        if data[:1] == bytes([PACKET_SAMPLES]):
+            return self.process_samples(data[1:])
+        if data[:1] == bytes([PACKET_TIMED_FRAME]) and len(data) > 1 + _TIMESTAMP.size:
+            (timestamp_ms,) = _TIMESTAMP.unpack_from(data, 1)
+            return self.process_frame(data[1 + _TIMESTAMP.size:], timestamp=timestamp_ms)
+        return self.process_frame(data)
+
+    def process_samples(self, payload):
+        """
+        Pre-averaged (timestamp, R, G, B) samples - no image decode needed.
+        """
+        usable = len(payload) - len(payload) % SAMPLE_DTYPE.itemsize
+        samples = np.frombuffer(payload[:usable], dtype=SAMPLE_DTYPE)
+        if len(samples) == 0:
+            return None
+        for t, g in zip(samples["t"].tolist(), samples["g"].tolist()):
+            self.add_measurement(g, timestamp=t / 1000.0)
+        return self._result(samples["g"][-1])
+
+    def process_frame(self, frame_bytes, timestamp=None):
+        """
+        timestamp is the client capture time in milliseconds, if known.
+        """
+        # Decode at reduced resolution (1/2, 1/4 or 1/8 for JPEG, chosen from the frame size)
+        img, factor = decode_reduced(frame_bytes, DECODE_MIN_SIDE, max_factor=DECODE_MAX_FACTOR)
+
         if img is None:
             return None
-            
-        # Detect Face (Simplified: Center Crop)
-        h, w, _ = img.shape
-        center_h, center_w = h // 2, w // 2
-        rect_size = 100
-        roi = img[center_h-rect_size:center_h+rect_size, center_w-rect_size:center_w+rect_size]
-        
-        # Calculate mean of Green channel
-        g_mean = np.mean(roi[:, :, 1])
-        
+
+        # Detect Face (Simplified: Center Crop), scaled to the decoded size
+        roi = center_roi(img, rect_size=ROI_HALF_SIZE // factor)
+
+        # Calculate mean of Green channel (cv2.mean reads the ROI view in place, no copy)
+        g_mean = cv2.mean(roi)[1]
+
         # Add to buffer
-        self.red_channel_buffer.append(g_mean)
-        if len(self.red_channel_buffer) > self.buffer_size:
-            self.red_channel_buffer.pop(0)
-        
+        self.add_measurement(g_mean, timestamp=timestamp / 1000.0 if timestamp is not None else None)
+        return self._result(g_mean)
+
+    def _result(self, g_mean):
         # Calculate signal for visualization
         signal_val = 0
-        if len(self.red_channel_buffer) > 10:
-             signal_val = g_mean - np.mean(self.red_channel_buffer)
-            
+        if self.count > 10:
+             signal_val = float(g_mean - self.running_sum / self.count)
+
         bpm, snr = self.calculate_heart_rate()
-        
-        return {
+
+        result = {
             "bpm": bpm,
             "signal": signal_val,
             "snr": snr
         }
-        
+        if self.measured_fps is not None:
+            result["fps"] = round(self.measured_fps, 1)
+        return result
+
     def calculate_heart_rate(self):
-        if len(self.red_channel_buffer) < self.buffer_size:
+        if self.mode == "streaming":
+            return self._streaming_heart_rate()
+        if self.mode == "batched":
+            # Estimated by the engine tick; this is the latest result for our row
+            row = self.engine_row
+            return self.engine.result(row) if row is not None else (None, 0)
+        return self._reference_heart_rate()
+
+    def _streaming_heart_rate(self):
+        # Wait until the ring holds only post-warmup filter output
+        if self.sos is None or self.filtered_count < self.buffer_size:
+            return None, 0
+        if self.last_estimate[0] is not None and self.frames_since_estimate < self.bpm_interval:
+            return self.last_estimate
+        self.frames_since_estimate = 0
+        filtered = self.ordered_buffer(self.filtered_buffer).astype(np.float64)
+        self.last_estimate = estimate_bpm(filtered, self.fps)
+        return self.last_estimate
+
+    def _reference_heart_rate(self):
+        if self.count < self.buffer_size:
             return None, 0
-            
+
         # Signal processing
-        data = np.array(self.red_channel_buffer)
-        
+        data = self.ordered_buffer().astype(np.float64)
+
         # Detrending
         detrended = signal.detrend(data)
-        
+
         # Bandpass Filter (0.7Hz to 4Hz -> 42 to 240 BPM)
-        try:
-            b, a = signal.butter(2, [0.7, 4.0], btype='bandpass', fs=self.fps)
-            filtered = signal.filtfilt(b, a, detrended)
-        except ValueError:
+        coeffs = design_bandpass(self.fps)
+        if coeffs is None:
+            return None, 0
+        b, a = coeffs
+        filtered = signal.filtfilt(b, a, detrended)
+
+        return estimate_bpm(filtered, self.fps)
+
+def analyze_video(path, window_seconds=10, step_seconds=1, chunk_size=64):
+    """
+    Batch rPPG over a recorded clip (webm/mp4).
+    Frames are decoded one at a time from disk; ROI channel means are computed per
+    chunk of frames in one vectorized pass, so memory stays bounded for long clips.
+    Returns overall BPM/SNR plus a per-window BPM timeline.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        return None
+
+    means = []
+    timestamps = []
+    chunk = None
+    filled = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            roi = center_roi(frame)
+            if chunk is None or chunk.shape[1:] != roi.shape:
+                if filled:
+                    means.append(chunk[:filled].mean(axis=(1, 2), dtype=np.float32))
+                chunk = np.empty((chunk_size,) + roi.shape, dtype=np.uint8)
+                filled = 0
+            chunk[filled] = roi
+            filled += 1
+            timestamps.append(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+            if filled == chunk_size:
+                means.append(chunk.mean(axis=(1, 2), dtype=np.float32))
+                filled = 0
+        if filled:
+            means.append(chunk[:filled].mean(axis=(1, 2), dtype=np.float32))
+        reported_fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+
+    if not means:
+        return None
+
+    channel_means = np.concatenate(means)  # (frames, 3) in BGR order
+    green = channel_means[:, 1].astype(np.float64)
+    timestamps = np.asarray(timestamps)
+    n_frames = len(green)
+
+    # Browser recordings (webm) often carry no usable fps; trust the frame timestamps when they are monotonic
+    duration = timestamps[-1] - timestamps[0] if n_frames > 1 else 0
+    if duration > 0 and np.all(np.diff(timestamps) > 0):
+        fps = (n_frames - 1) / duration
+    elif 0 < reported_fps < 240:
+        fps = reported_fps
+        duration = (n_frames - 1) / fps
+    else:
+        fps = 30
+        duration = (n_frames - 1) / fps
+
+    sos = design_bandpass(fps, output='sos')
+    window = int(round(window_seconds * fps))
+    if sos is None or n_frames < min(window, 3 * fps):
+        return {"bpm": None, "snr": 0, "fps": round(fps, 2), "frames": n_frames, "timeline": []}
+
+    # Whole-trace detrend + zero-phase bandpass in one pass
+    filtered = signal.sosfiltfilt(sos, signal.detrend(green))
+
+    window = min(window, n_frames)
+    step = max(1, int(round(step_seconds * fps)))
+    windows = np.lib.stride_tricks.sliding_window_view(filtered, window)[::step]
+    window_bpm, window_snr = spectral_bpm(windows, fps)
+    centers = (np.arange(len(windows)) * step + window / 2) / fps
+
+    return {
+        "bpm": int(round(np.median(window_bpm))),
+        "snr": round(float(np.median(window_snr)), 2),
+        "fps": round(fps, 2),
+        "frames": n_frames,
+        "duration_seconds": round(float(duration), 2),
+        "timeline": [
+            {"t": round(float(t), 2), "bpm": int(round(b)), "snr": round(float(q), 2)}
+            for t, b, q in zip(centers, window_bpm, window_snr)
+        ]
+    }
+
+class RPPGEngine:
+    """
+    Vectorized multi-session estimator. Every batched session's uniform-grid signal is
+    one row of a single (sessions x samples) float32 array. Each tick detrends, filters
+    and computes spectral BPM for all due rows in one NumPy/SciPy pass, instead of
+    many small per-session calls; sessions read their row's latest result on their
+    next reply.
+    """
+    def __init__(self, capacity=1024, buffer_size=150, fps=30, bpm_interval=15, tick_interval=0.5):
+        self.capacity = capacity
+        self.buffer_size = buffer_size
+        self.fps = fps
+        self.bpm_interval = bpm_interval
+        self.tick_interval = tick_interval
+        self.signals = np.zeros((capacity, buffer_size), dtype=np.float32)
+        self.write_index = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.since_estimate = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.bpm = np.full(capacity, np.nan, dtype=np.float32)
+        self.snr = np.zeros(capacity, dtype=np.float32)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._task = None
+        self.ticks = 0
+        self.last_tick_rows = 0
+        self.last_tick_ms = 0.0
+
+    def allocate(self):
+        with self._lock:
+            if not self._free:
+                return None
+            row = self._free.pop()
+            self.signals[row].fill(0)
+            self.write_index[row] = 0
+            self.counts[row] = 0
+            self.since_estimate[row] = 0
+            self.bpm[row] = np.nan
+            self.snr[row] = 0
+            self.active[row] = True
+            return row
+
+    def release(self, row):
+        with self._lock:
+            if self.active[row]:
+                self.active[row] = False
+                self._free.append(row)
+
+    def advance(self, row, write_index, count, new_samples=0):
+        # Called by the owning processor after it writes into its row
+        self.write_index[row] = write_index
+        self.counts[row] = count
+        if count == 0:
+            self.since_estimate[row] = 0
+            self.bpm[row] = np.nan
+        else:
+            self.since_estimate[row] += new_samples
+
+    def result(self, row):
+        bpm = self.bpm[row]
+        if np.isnan(bpm):
             return None, 0
-            
-        # Time Domain Peak Detection
-        peaks, properties = signal.find_peaks(filtered, distance=self.fps/2.5, prominence=0.1) # Min dist ~0.4s (150 BPM limit) for stability
-        
-        bpm = 0
-        snr = 0
-        
-        if len(peaks) > 2:
-            # Calculate BPM from peak intervals
-            intervals = np.diff(peaks)
-            avg_interval = np.mean(intervals)
-            bpm = (60 * self.fps) / avg_interval
-            
-            # Simple SNR: Peak height vs background noise
-            signal_power = np.mean(filtered[peaks]**2)
-            noise_power = np.mean(filtered**2) - signal_power
-            if noise_power > 0:
-                snr = 10 * np.log10(signal_power / noise_power)
-        
-        # Fallback to FFT if time domain fails or is erratic
-        if bpm == 0 or bpm > 200 or bpm < 40:
-             # FFT
-            fft = np.fft.rfft(filtered)
-            freqs = np.fft.rfftfreq(len(filtered), 1.0/self.fps)
-            msg_idx = np.argmax(np.abs(fft))
-            bpm = freqs[msg_idx] * 60
-            
-        return int(bpm), round(snr, 2)
-
-# Global instance for demo simple state
-processor = RPPGProcessor()
+        return int(bpm), round(float(self.snr[row]), 2)
+
+    def tick(self):
+        """
+        Estimates BPM for every full row with at least bpm_interval new samples.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            due = self.active & (self.counts >= self.buffer_size) & (self.since_estimate >= self.bpm_interval)
+            rows = np.flatnonzero(due)
+            if len(rows) == 0:
+                return 0
+            # Gather each ring oldest-first in one fancy-indexing pass
+            order = (self.write_index[rows, None] + np.arange(self.buffer_size)) % self.buffer_size
+            data = self.signals[rows[:, None], order].astype(np.float64)
+            self.since_estimate[rows] = 0
+
+        sos = design_bandpass(self.fps, output='sos')
+        if sos is None:
+            return 0
+        filtered = signal.sosfiltfilt(sos, signal.detrend(data, axis=1), axis=1)
+        bpm, snr = spectral_bpm(filtered, self.fps)
+
+        with self._lock:
+            # Skip rows released (or reallocated) while we were computing
+            still_active = self.active[rows]
+            self.bpm[rows[still_active]] = bpm[still_active]
+            self.snr[rows[still_active]] = snr[still_active]
+
+        self.ticks += 1
+        self.last_tick_rows = len(rows)
+        self.last_tick_ms = round((time.perf_counter() - start) * 1000, 2)
+        return len(rows)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await asyncio.to_thread(self.tick)
+            except Exception as e:
+                logger.error(f"rPPG engine tick failed: {e}")
+
+    def ensure_started(self):
+        """
+        Starts the tick loop on the running event loop (first batched session).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "active_rows": int(self.active.sum()),
+            "ticks": self.ticks,
+            "last_tick_rows": self.last_tick_rows,
+            "last_tick_ms": self.last_tick_ms
+        }
+
+# Shared engine for batched sessions
+engine = RPPGEngine()
+
+class RPPGSessionManager:
+    """
+    Keeps one RPPGProcessor per client (websocket connection or explicit session id)
+    so concurrent patients never share a signal buffer.
+    Idle sessions are evicted, and the total buffer memory is capped.
+    """
+    def __init__(self, buffer_size=150, idle_timeout=120, max_memory_bytes=64 * 1024 * 1024,
+                 mode=RPPG_MODE, bpm_interval=15, engine=None):
+        self.buffer_size = buffer_size
+        self.mode = mode
+        self.bpm_interval = bpm_interval
+        self.engine = engine
+        self.idle_timeout = idle_timeout
+        # Signal + filtered ring buffers per session
+        self.max_sessions = max(1, max_memory_bytes // (2 * buffer_size * np.dtype(np.float32).itemsize))
+        self._sessions = OrderedDict()  # session_id -> (processor, last_seen), LRU order
+        self._lock = threading.Lock()
+        # Websocket pipeline counters (see routers/vitals.py)
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def record_frames(self, processed=0, dropped=0):
+        with self._lock:
+            self.frames_processed += processed
+            self.frames_dropped += dropped
+
+    def new_session_id(self):
+        return uuid.uuid4().hex
+
+    def get(self, session_id, mode=None):
+        """
+        Returns the processor for session_id, creating it if needed.
+        mode only applies when the session is created.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry:
+                processor = entry[0]
+                self._sessions.move_to_end(session_id)
+            else:
+                self._evict_idle(now)
+                # Memory cap reached: drop the least recently used session
+                while len(self._sessions) >= self.max_sessions:
+                    evicted_id, (evicted, _) = self._sessions.popitem(last=False)
+                    evicted.close()
+                    logger.warning(f"rPPG session cap reached, evicted {evicted_id}")
+                processor = RPPGProcessor(buffer_size=self.buffer_size, mode=mode or self.mode,
+                                          bpm_interval=self.bpm_interval, engine=self.engine)
+            self._sessions[session_id] = (processor, now)
+            return processor
+
+    def release(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry:
+            entry[0].close()
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now):
+        # Sessions are kept in LRU order, so idle ones are at the front
+        evicted = 0
+        while self._sessions:
+            session_id, (_, last_seen) = next(iter(self._sessions.items()))
+            if now - last_seen < self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)[1][0].close()
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "buffer_bytes": sum(p.nbytes for p, _ in self._sessions.values()),
+                "frames_processed": self.frames_processed,
+                "frames_dropped": self.frames_dropped,
+                "engine": self.engine.stats() if self.engine else None
+            }
+
+# Global session registry - one processor per connected client
+sessions = RPPGSessionManager(engine=engine)
@@ -1,55 +1,129 @@
 import cv2
-import numpy as np
-from PIL import Image
+import os
+import time
+from image_utils import decode_reduced
+from model_registry import registry
+from result_cache import ResultCache
 try:
-    from yolo_adapter import AyurYOLO
+    from yolo_adapter import load_classifier, InferenceScheduler
     _HAS_YOLO = True
 except ImportError:
     _HAS_YOLO = False
-    class AyurYOLO: 
-        def __init__(self): pass
-        def predict(self, img): return 0.0, 0
+
+# HSV colour means are stable at thumbnail size; this also covers the 224px classifier input
+THUMBNAIL_MIN_SIDE = 256
+
+# Bump when the heuristics or the response shape change - invalidates cached results
+ANALYZER_VERSION = "2"
+
+# Classifier forward pass per request (fills `model_prediction` only; the diagnosis is
+# heuristic). Off by default: the model is loaded but, as before, not run.
+VISION_MODEL_INFERENCE = os.getenv("AYURAI_VISION_MODEL_INFERENCE", "0") == "1"
+
+# Content-addressed results: re-submitted photos skip decode and inference.
+# AYURAI_VISION_CACHE_DB enables the on-disk tier shared by workers.
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("AYURAI_VISION_CACHE_BYTES", str(32 * 1024 * 1024))),
+    ttl=int(os.getenv("AYURAI_VISION_CACHE_TTL", str(24 * 3600))),
+    disk_path=os.getenv("AYURAI_VISION_CACHE_DB")
+)
+
+def cache_version(model_path=None):
+    """
+    Heuristic version + model identity (path, size, mtime), so swapping weights invalidates the cache.
+    """
+    if not model_path or not VISION_MODEL_INFERENCE:
+        return f"{ANALYZER_VERSION}:no-model"
+    try:
+        stat = os.stat(model_path)
+        return f"{ANALYZER_VERSION}:{model_path}:{stat.st_size}:{int(stat.st_mtime)}"
+    except (OSError, TypeError):
+        return f"{ANALYZER_VERSION}:{model_path}"
 
 class TongueAnalyzer:
     def __init__(self):
         # Initialize YOLOv8n-cls ONLY if available
         if _HAS_YOLO:
             try:
-                self.model = AyurYOLO()
+                # AyurYOLO or the ONNX Runtime classifier, per AYURAI_VISION_BACKEND
+                self.model = load_classifier()
+                # Concurrent requests share batched forward passes
+                self.scheduler = InferenceScheduler(self.model)
                 self.classes = ["Healthy/Balanced", "Vata Imbalance", "Pitta Imbalance", "Kapha Imbalance"]
             except Exception as e:
                 print(f"Failed to load YOLO: {e}")
                 self.model = None
+                self.scheduler = None
         else:
             self.model = None
+            self.scheduler = None
             self.classes = []
         
+    @property
+    def cache_version(self):
+        return cache_version(getattr(self.model, "model_path", type(self.model).__name__) if self.model else None)
+
+    def analyze_cached(self, image_bytes):
+        """
+        analyze_image behind the content-addressed result cache.
+        """
+        key = result_cache.key(image_bytes, self.cache_version)
+        cached = result_cache.get(key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+        result = self.analyze_image(image_bytes)
+        if result:
+            result_cache.put(key, result)
+        return result
+
+    def decode_thumbnail(self, image_bytes):
+        """
+        Single decode at reduced resolution: JPEG is scaled during decode (1/2, 1/4, 1/8),
+        other formats are decoded once and shrunk. Returns a BGR thumbnail or None.
+        """
+        img, factor = decode_reduced(image_bytes, THUMBNAIL_MIN_SIDE)
+        if img is None:
+            return None
+        short_side = min(img.shape[:2])
+        if short_side > 2 * THUMBNAIL_MIN_SIDE:
+            scale = THUMBNAIL_MIN_SIDE / short_side
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return img
+
     def analyze_image(self, image_bytes):
-        # 1. Preprocessing
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img_cv = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        timings = {}
+        start = time.perf_counter()
+
+        # 1. Preprocessing (one decode, thumbnail-sized)
+        img_cv = self.decode_thumbnail(image_bytes)
         
         if img_cv is None:
             return None
+        timings["decode"] = (time.perf_counter() - start) * 1000
             
-        # Convert to PIL for YOLO
-        img_rgb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img_rgb)
-        
-        # 2. Heuristic Analysis (Color Metrics)
+        # 2. Heuristic Analysis (Color Metrics) on the thumbnail
+        stage = time.perf_counter()
         hsv_img = cv2.cvtColor(img_cv, cv2.COLOR_BGR2HSV)
-        avg_hsv = np.mean(hsv_img, axis=(0, 1))
+        avg_hsv = cv2.mean(hsv_img)
         
         metrics = {
              "hue": float(avg_hsv[0]), 
              "saturation": float(avg_hsv[1]), 
              "value": float(avg_hsv[2])
         }
+        timings["color_metrics"] = (time.perf_counter() - stage) * 1000
 
-        if self.model:
-            # 3. YOLO Inference (Maha-Vajra Large Model) - Only if model loaded
-            # For now, we are simulating high confidence regardless for the demo
-            pass
+        model_prediction = None
+        if self.model and VISION_MODEL_INFERENCE:
+            # 3. YOLO Inference (Maha-Vajra Large Model) - Only if model loaded and enabled
+            # Ultralytics takes the BGR thumbnail as-is, so no RGB/PIL copy is needed here.
+            # For now the diagnosis below still simulates high confidence for the demo;
+            # the raw model output is returned alongside it.
+            stage = time.perf_counter()
+            conf, idx = self.scheduler.predict(img_cv)
+            model_prediction = {"class_index": int(idx), "confidence": float(conf)}
+            timings["inference"] = (time.perf_counter() - stage) * 1000
 
         if True: # Force High-Confidence Demo Mode
             # 3. Demo Logic: Map heuristics to "Perfect Profiles"
@@ -94,10 +168,20 @@ class TongueAnalyzer:
             # Safe Disclaimer
             diagnosis_result.append("Note: AI Prototype Analysis - Not a medical diagnosis.")
 
-        return {
+        timings["total"] = (time.perf_counter() - start) * 1000
+
+        result = {
             "diagnosis": diagnosis_result,
             "color_metrics": metrics,
-            "confidence": float(final_conf)
+            "confidence": float(final_conf),
+            "timings_ms": {k: round(v, 2) for k, v in timings.items()}
         }
+        if model_prediction:
+            result["model_prediction"] = model_prediction
+        return result
+
+# Built lazily (or by the startup warm-up) - loading YOLO is the slow part of startup
+registry.register("tongue_analyzer", TongueAnalyzer)
 
-analyzer = TongueAnalyzer()
+def get_analyzer():
+    return registry.get("tongue_analyzer")
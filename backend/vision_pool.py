@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+from model_registry import registry
+
+logger = logging.getLogger("AyurAI.VisionPool")
+
+# Worker processes for tongue analysis; 0 keeps analysis in the API process threadpool
+VISION_WORKERS = int(os.getenv("AYURAI_VISION_WORKERS", "0"))
+
+# --- Worker process side ---
+
+_analyzer = None  # one TongueAnalyzer (and model) per worker process
+
+def _init_worker():
+    global _analyzer
+    logging.basicConfig(level=logging.INFO)
+    from vision import get_analyzer
+    _analyzer = get_analyzer()
+
+def _ping(_=None):
+    return os.getpid()
+
+def _attach(name):
+    # The API process owns the segment and unlinks it. Spawned workers share its
+    # resource tracker, so attaching here must not (and on < 3.13 does not) add a second owner.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+def _analyze_shared(name, size):
+    shm = _attach(name)
+    try:
+        # Decoded straight from the shared buffer; the image bytes are never pickled
+        view = shm.buf[:size]
+        try:
+            return _analyzer.analyze_image(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+# --- API process side ---
+
+class VisionWorkerPool:
+    """
+    Tongue analysis in dedicated worker processes, so decode, colour metrics and
+    ultralytics pre/post-processing run outside the API process's GIL.
+    Each worker loads the model once (pool initializer). Uploads are copied into a
+    shared memory segment and only its name crosses the process boundary.
+    A worker crash breaks the executor; it is rebuilt and the request retried once.
+    """
+    def __init__(self, workers=VISION_WORKERS):
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self.tasks = 0
+        self.failures = 0
+        self.restarts = 0
+        self._executor = self._create()
+
+    def _create(self):
+        # spawn: workers must not inherit the API process's threads or a half-initialised torch
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"),
+                                   initializer=_init_worker)
+
+    def warm(self):
+        """
+        Starts the workers (one submit each) and waits until at least one has its model loaded.
+        """
+        start = time.perf_counter()
+        list(self._executor.map(_ping, range(self.workers)))
+        logger.info(f"Vision pool ({self.workers} workers) warm in {time.perf_counter() - start:.2f}s")
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is not broken:
+                return  # another request already replaced it
+            logger.error("Vision worker crashed; restarting pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create()
+            self.restarts += 1
+
+    async def analyze(self, image_bytes):
+        size = len(image_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        try:
+            shm.buf[:size] = image_bytes
+            self.tasks += 1
+            for attempt in range(2):
+                executor = self._executor
+                try:
+                    return await asyncio.wrap_future(executor.submit(_analyze_shared, shm.name, size))
+                except BrokenProcessPool:
+                    self._restart(executor)
+                    if attempt:
+                        self.failures += 1
+                        raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def analyze_cached(self, image_bytes):
+        """
+        analyze() behind the vision result cache, looked up in the API process so hits
+        never touch a worker.
+        """
+        from vision import result_cache, cache_version
+        from yolo_adapter import configured_model_path
+        key = await asyncio.to_thread(result_cache.key, image_bytes, cache_version(configured_model_path()))
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+        result = await self.analyze(image_bytes)
+        if result:
+            await asyncio.to_thread(result_cache.put, key, result)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "tasks": self.tasks,
+            "failures": self.failures,
+            "restarts": self.restarts
+        }
+
+def _create_pool():
+    pool = VisionWorkerPool(VISION_WORKERS)
+    pool.warm()
+    return pool
+
+# Only registered when enabled: the router imports this module for VISION_WORKERS, and the
+# startup warm-up must not spawn workers nobody will use
+if VISION_WORKERS:
+    registry.register("vision_pool", _create_pool)
+
+def get_pool():
+    return registry.get("vision_pool")
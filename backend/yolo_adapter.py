@@ -1,33 +1,224 @@
-from ultralytics import YOLO
+from concurrent.futures import Future
 import logging
 import os
+import queue
+import threading
+import time
 
 logger = logging.getLogger("AyurAI.YOLO")
 
+# Micro-batching defaults (see InferenceScheduler)
+YOLO_MAX_BATCH = int(os.getenv("AYURAI_YOLO_MAX_BATCH", "8"))
+YOLO_MAX_WAIT_MS = float(os.getenv("AYURAI_YOLO_MAX_WAIT_MS", "10"))
+# Test-time augmentation: several forward passes per image
+YOLO_TTA = os.getenv("AYURAI_YOLO_TTA", "0") == "1"
+
+YOLO_MODEL_PATH = os.getenv("AYURAI_YOLO_MODEL", "yolov8l-cls.pt")
+
+# Cascade: a small model answers confident cases, the large model (TTA if enabled) the rest
+VISION_CASCADE = os.getenv("AYURAI_VISION_CASCADE", "0") == "1"
+YOLO_FAST_MODEL_PATH = os.getenv("AYURAI_YOLO_FAST_MODEL", "yolov8n-cls.pt")
+ONNX_FAST_MODEL_PATH = os.getenv("AYURAI_ONNX_FAST_MODEL", "yolov8n-cls.onnx")
+CASCADE_THRESHOLD = float(os.getenv("AYURAI_CASCADE_THRESHOLD", "0.6"))
+
+# "torch" (ultralytics/PyTorch) or "onnx" (ONNX Runtime, see onnx_backend.py)
+VISION_BACKEND = os.getenv("AYURAI_VISION_BACKEND", "torch")
+ONNX_MODEL_PATH = os.getenv("AYURAI_ONNX_MODEL", "yolov8l-cls.onnx")
+ONNX_NORMALIZATION = os.getenv("AYURAI_ONNX_NORMALIZATION", "yolo")  # "imagenet" for AyurVisionNet exports
+
 class AyurYOLO:
-    def __init__(self, model_path="yolov8l-cls.pt"):
+    def __init__(self, model_path=YOLO_MODEL_PATH, augment=YOLO_TTA):
+        # Imported here so the ONNX backend never loads torch/ultralytics
+        from ultralytics import YOLO
         # Load the "Large" YOLOv8 model - The strongest standard classifier in the v8 family
         # capable of detecting intricate textures and micro-patterns.
-        self.model = YOLO(model_path) 
-        logger.info(f"Loaded Maha-Vajra-YOLO (v8l-cls) from {model_path}")
+        self.model = YOLO(model_path)
+        self.model_path = model_path
+        self.augment = augment
+        logger.info(f"Loaded Maha-Vajra-YOLO from {model_path}")
 
     def predict(self, image):
         """
         Runs inference on the image.
         Returns top class index and confidence.
         """
-        # Run inference with Test Time Augmentation (augment=True)
-        # This creates multiple cropped/flipped versions internally and averages the results
-        results = self.model(image, verbose=False, augment=True)
-        
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, augment=None):
+        """
+        One forward pass over a list of images.
+        Returns [(confidence, class index)] in input order.
+        """
+        # Test Time Augmentation (AYURAI_YOLO_TTA=1) runs cropped/flipped versions internally
+        # and averages the results
+        augment = self.augment if augment is None else augment
+        results = self.model(images, verbose=False, augment=augment)
+
         # Extract classification results
         # Note: Since this is pretrained on ImageNet, we map the output abstractly for the demo
         # knowing that we'd normally train it on a custom dataset.
-        
-        # results[0].probs is the specific attribute for classification models
-        if results and results[0].probs:
-            probs = results[0].probs.data
-            conf, idx = probs.topk(1)
-            return conf.item(), idx.item()
-        
-        return 0.0, 0
+
+        # results[i].probs is the specific attribute for classification models
+        predictions = []
+        for result in results:
+            if result.probs is not None:
+                conf, idx = result.probs.data.topk(1)
+                predictions.append((conf.item(), idx.item()))
+            else:
+                predictions.append((0.0, 0))
+        return predictions
+
+class CascadeClassifier:
+    """
+    Two-stage classifier: every image goes through the fast model (no TTA); images whose
+    top-1 confidence is below `threshold` are re-run, as one batch, on the slow model.
+    Counts escalations and the time spent in each stage.
+    """
+    def __init__(self, fast, slow, threshold=CASCADE_THRESHOLD):
+        self.fast = fast
+        self.slow = slow
+        self.threshold = threshold
+        self.model_path = f"{fast.model_path}|{slow.model_path}@{threshold}"
+        self.images = 0
+        self.escalated = 0
+        self.fast_seconds = 0.0
+        self.slow_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, augment=None):
+        # `augment` is per stage: never on the fast model, the slow model keeps its own setting
+        start = time.perf_counter()
+        predictions = self.fast.predict_batch(images, augment=False)
+        fast_seconds = time.perf_counter() - start
+
+        hard = [i for i, (conf, _) in enumerate(predictions) if conf < self.threshold]
+        slow_seconds = 0.0
+        if hard:
+            start = time.perf_counter()
+            for i, prediction in zip(hard, self.slow.predict_batch([images[i] for i in hard])):
+                predictions[i] = prediction
+            slow_seconds = time.perf_counter() - start
+
+        with self._lock:
+            self.images += len(images)
+            self.escalated += len(hard)
+            self.fast_seconds += fast_seconds
+            self.slow_seconds += slow_seconds
+        return predictions
+
+    def stats(self):
+        with self._lock:
+            total_seconds = self.fast_seconds + self.slow_seconds
+            return {
+                "threshold": self.threshold,
+                "images": self.images,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / self.images, 3) if self.images else 0,
+                "fast_ms_per_image": round(self.fast_seconds * 1000 / self.images, 2) if self.images else 0,
+                "slow_ms_per_escalation": round(self.slow_seconds * 1000 / self.escalated, 2) if self.escalated else 0,
+                "slow_time_share": round(self.slow_seconds / total_seconds, 3) if total_seconds else 0
+            }
+
+def _load_single(backend, model_path):
+    if backend == "onnx":
+        from onnx_backend import OnnxClassifier
+        return OnnxClassifier(model_path, normalization=ONNX_NORMALIZATION)
+    if backend != "torch":
+        raise ValueError(f"Unknown vision backend: {backend}")
+    return AyurYOLO(model_path)
+
+def _model_paths(backend):
+    # (fast, slow) weights for the backend
+    if backend == "onnx":
+        return ONNX_FAST_MODEL_PATH, ONNX_MODEL_PATH
+    return YOLO_FAST_MODEL_PATH, YOLO_MODEL_PATH
+
+def load_classifier(backend=VISION_BACKEND, cascade=VISION_CASCADE):
+    """
+    Tongue classifier for the configured backend. All variants expose predict / predict_batch.
+    """
+    fast_path, slow_path = _model_paths(backend)
+    slow = _load_single(backend, slow_path)
+    if not cascade:
+        return slow
+    return CascadeClassifier(_load_single(backend, fast_path), slow)
+
+def configured_model_path(backend=VISION_BACKEND, cascade=VISION_CASCADE):
+    """
+    Model identity load_classifier() would produce, without loading anything.
+    """
+    fast_path, slow_path = _model_paths(backend)
+    return f"{fast_path}|{slow_path}@{CASCADE_THRESHOLD}" if cascade else slow_path
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching in front of a model with predict_batch().
+    Concurrent callers (threadpool workers) submit single images; a worker thread
+    collects requests for up to max_wait_ms or max_batch_size images, runs one
+    batched forward pass and resolves each caller's future with its own result.
+    """
+    def __init__(self, model, max_batch_size=YOLO_MAX_BATCH, max_wait_ms=YOLO_MAX_WAIT_MS, augment=None):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.augment = augment
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self._worker = threading.Thread(target=self._run, name="yolo-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image):
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """
+        Blocking helper for threadpool callers. Returns (confidence, class index).
+        """
+        return self.submit(image).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Skip requests whose caller already cancelled
+            batch = [(image, future) for image, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            images = [image for image, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                predictions = self.model.predict_batch(images, augment=self.augment)
+                for future, prediction in zip(futures, predictions):
+                    future.set_result(prediction)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for future in futures:
+                    future.set_exception(e)
+            self.batches += 1
+            self.requests += len(images)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }